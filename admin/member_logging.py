@@ -97,6 +97,11 @@ class MemberLogging:
 
     async def on_member_join(self, member):
         """メンバーの参加を検知してログに記録"""
+        anti_raid = self.bot.get_cog('AntiRaid')
+        if anti_raid is not None and anti_raid.observe(member):
+            # ロックダウン中の参加はロックダウン終了時にまとめてログに残す
+            return
+
         embed = discord.Embed(title="メンバー参加", color=discord.Color.green())
         member_name = member.display_name
 
@@ -11,8 +11,10 @@ class MessageLogging:
 
     async def on_message(self, message):
         """メッセージの投稿を記録"""
-        if message.author.bot:
+        if message.author.bot or message.guild is None:
             return
+        # 統計はメモリ上で集計し、StatsBufferが定期的にまとめて書き込む
+        self.bot.stats_buffer.record_message(message.guild.id, message.author.id)
         self.logger.info(f"{message.guild.name} - #{message.channel.name}: {message.author.name}: {message.content}")
 
     async def on_message_edit(self, before, after):
@@ -7,6 +7,14 @@ class VoiceLogging:
         self.bot = logging_cog.bot
         self.logger = logging_cog.logger
 
+    def recover_sessions(self):
+        """現在のVC参加者から滞在セッションを復元する"""
+        for guild in self.bot.guilds:
+            try:
+                self.bot.stats_buffer.voice.recover_guild(guild)
+            except Exception as e:
+                self.logger.error(f"VCセッションの復元中にエラーが発生しました（ギルド: {guild.id}）: {e}")
+
     async def on_voice_state_update(self, member, before, after):
         """
         ボイスチャンネルの参加/退出を検知してログを送信する
@@ -20,6 +28,9 @@ class VoiceLogging:
         after : discord.VoiceState
             変更後の状態
         """
+        # VC滞在時間の集計（メモリ上のみ、DBへはStatsBufferがまとめて書き込む）
+        self.bot.stats_buffer.voice.on_voice_state_update(member, before, after)
+
         if before.channel != after.channel:
             now = datetime.now(timezone.utc)  # UTCタイムゾーンを使用
     
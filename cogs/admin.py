@@ -5,6 +5,13 @@ from datetime import datetime, timezone, timedelta
 import logging
 from typing import List, Tuple, Optional, Dict
 import io
+import os
+from database import day_number
+from utils.guild_settings import DEFAULT_SPAM_SETTINGS, SPAM_ACTIONS, SPAM_WINDOW_LIMITS, VERIFICATION_LEVELS
+from utils.stats_export import EXPORT_QUERIES, export_filename, write_export
+
+# 添付できないサイズのエクスポートを保存するディレクトリ
+EXPORT_DIR = 'exports'
 
 class AdminCog(commands.Cog):
     def __init__(self, bot):
@@ -567,29 +574,20 @@ class AdminCog(commands.Cog):
         app_commands.Choice(name="count", value="count"),
         app_commands.Choice(name="time", value="time"),
         app_commands.Choice(name="action", value="action"),
-        app_commands.Choice(name="timeout", value="timeout")
+        app_commands.Choice(name="timeout", value="timeout"),
+        app_commands.Choice(name="purge", value="purge"),
+        app_commands.Choice(name="mentions", value="mentions"),
+        app_commands.Choice(name="mention_window", value="mention_window")
     ])
     async def setspam(self, interaction: discord.Interaction, setting: str, value: str):
         try:
             guild_config = self.bot.config_manager.get_guild_config(str(interaction.guild_id))
             if not guild_config:
-                guild_config = {
-                    'spam_settings': {
-                        'message_count': 5,
-                        'time_window': 5,
-                        'action': 'timeout',
-                        'timeout_duration': 300
-                    }
-                }
+                guild_config = {'spam_settings': dict(DEFAULT_SPAM_SETTINGS)}
             elif 'spam_settings' not in guild_config:
-                guild_config['spam_settings'] = {
-                    'message_count': 5,
-                    'time_window': 5,
-                    'action': 'timeout',
-                    'timeout_duration': 300
-                }
-
-            if setting == 'action' and value not in ['timeout', 'delete', 'ban']:
+                guild_config['spam_settings'] = dict(DEFAULT_SPAM_SETTINGS)
+
+            if setting == 'action' and value not in SPAM_ACTIONS:
                 await interaction.response.send_message("Invalid action. Use: timeout, delete, or ban", ephemeral=True)
                 return
 
@@ -606,9 +604,17 @@ class AdminCog(commands.Cog):
                 'count': 'message_count',
                 'time': 'time_window',
                 'action': 'action',
-                'timeout': 'timeout_duration'
+                'timeout': 'timeout_duration',
+                'purge': 'purge_window',
+                'mentions': 'mention_limit',
+                'mention_window': 'mention_window'
             }
 
+            limit = SPAM_WINDOW_LIMITS.get(setting_mapping[setting])
+            if limit is not None and value > limit:
+                await interaction.response.send_message(f"Please provide a value of {limit} seconds or less.", ephemeral=True)
+                return
+
             guild_config['spam_settings'][setting_mapping[setting]] = value
             self.bot.config_manager.update_guild_config(str(interaction.guild_id), guild_config)
             await interaction.response.send_message(f"Spam setting '{setting}' has been updated to: {value}")
@@ -616,6 +622,112 @@ class AdminCog(commands.Cog):
             self.logger.error(f"Error in setspam: {e}")
             await interaction.response.send_message("設定中にエラーが発生しました。", ephemeral=True)
 
+    @app_commands.command(name="setraid", description="参加レイド対策の設定を変更")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.choices(setting=[
+        app_commands.Choice(name="enabled", value="enabled"),
+        app_commands.Choice(name="threshold", value="join_threshold"),
+        app_commands.Choice(name="window", value="join_window"),
+        app_commands.Choice(name="account_days", value="new_account_days"),
+        app_commands.Choice(name="duration", value="lockdown_duration"),
+        app_commands.Choice(name="verification", value="verification_level"),
+        app_commands.Choice(name="slowmode", value="slowmode"),
+        app_commands.Choice(name="timeout_joiners", value="timeout_joiners"),
+        app_commands.Choice(name="timeout", value="timeout_duration")
+    ])
+    async def setraid(self, interaction: discord.Interaction, setting: str, value: str):
+        try:
+            if setting in ('enabled', 'timeout_joiners'):
+                if value.lower() not in ('true', 'false', 'on', 'off'):
+                    await interaction.response.send_message("Please provide true or false.", ephemeral=True)
+                    return
+                value = value.lower() in ('true', 'on')
+            elif setting == 'verification_level':
+                if value not in VERIFICATION_LEVELS:
+                    await interaction.response.send_message(
+                        f"Invalid level. Use: {', '.join(VERIFICATION_LEVELS)}", ephemeral=True
+                    )
+                    return
+            else:
+                try:
+                    value = int(value)
+                    # 低速モードとアカウント日数は0（変更しない・重み付けしない）を許可する
+                    if value < 0 or (value == 0 and setting not in ('slowmode', 'new_account_days')):
+                        raise ValueError
+                except ValueError:
+                    await interaction.response.send_message("Please provide a valid positive number.", ephemeral=True)
+                    return
+
+            guild_config = self.bot.config_manager.get_guild_config(str(interaction.guild_id)) or {}
+            raid_settings = dict(guild_config.get('raid_settings') or {})
+            raid_settings[setting] = value
+            self.bot.config_manager.update_guild_config(str(interaction.guild_id), {'raid_settings': raid_settings})
+            await interaction.response.send_message(f"Raid setting '{setting}' has been updated to: {value}")
+        except Exception as e:
+            self.logger.error(f"Error in setraid: {e}")
+            await interaction.response.send_message("設定中にエラーが発生しました。", ephemeral=True)
+
+    @app_commands.command(name="setautoslowmode", description="自動低速モードの設定を変更")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.choices(setting=[
+        app_commands.Choice(name="enabled", value="enabled"),
+        app_commands.Choice(name="rate", value="rate_threshold"),
+        app_commands.Choice(name="authors", value="author_threshold"),
+        app_commands.Choice(name="max_delay", value="max_delay"),
+        app_commands.Choice(name="hold_time", value="hold_time"),
+        app_commands.Choice(name="edits_per_hour", value="max_edits_per_hour")
+    ])
+    async def setautoslowmode(self, interaction: discord.Interaction, setting: str, value: str):
+        try:
+            if setting == 'enabled':
+                if value.lower() not in ('true', 'false', 'on', 'off'):
+                    await interaction.response.send_message("Please provide true or false.", ephemeral=True)
+                    return
+                value = value.lower() in ('true', 'on')
+            else:
+                try:
+                    value = int(value)
+                    if value <= 0 or (setting == 'max_delay' and value > 21600):
+                        raise ValueError
+                except ValueError:
+                    await interaction.response.send_message("Please provide a valid positive number.", ephemeral=True)
+                    return
+
+            guild_config = self.bot.config_manager.get_guild_config(str(interaction.guild_id)) or {}
+            slowmode_settings = dict(guild_config.get('slowmode_settings') or {})
+            slowmode_settings[setting] = value
+            self.bot.config_manager.update_guild_config(
+                str(interaction.guild_id), {'slowmode_settings': slowmode_settings}
+            )
+            await interaction.response.send_message(f"Auto slowmode setting '{setting}' has been updated to: {value}")
+        except Exception as e:
+            self.logger.error(f"Error in setautoslowmode: {e}")
+            await interaction.response.send_message("設定中にエラーが発生しました。", ephemeral=True)
+
+    @app_commands.command(name="setretention", description="統計データの保持日数を設定")
+    @app_commands.describe(days="ユーザーごとの統計を残す日数（7日以上）")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def setretention(self, interaction: discord.Interaction, days: int):
+        try:
+            if days < 7:
+                await interaction.response.send_message("保持日数は7日以上で指定してください。", ephemeral=True)
+                return
+
+            success = self.bot.config_manager.update_guild_config(
+                str(interaction.guild_id), {'stats_retention_days': days}
+            )
+            if success:
+                await interaction.response.send_message(
+                    f"ユーザーごとの統計の保持日数を{days}日に設定しました。\n"
+                    "それより古いデータはサーバー全体の集計のみ残ります。",
+                    ephemeral=True
+                )
+            else:
+                raise Exception("Failed to save configuration")
+        except Exception as e:
+            self.logger.error(f"Error in setretention: {e}")
+            await interaction.response.send_message("設定中にエラーが発生しました。", ephemeral=True)
+
     @app_commands.command(name="wordlist", description="禁止ワードリストを表示")
     @app_commands.checks.has_permissions(administrator=True)
     async def wordlist(self, interaction: discord.Interaction):
@@ -660,27 +772,20 @@ class AdminCog(commands.Cog):
             
             roles = len(guild.roles) - 1
             
-            cursor = self.bot.db.cursor
-            today = datetime.datetime.now().strftime('%Y-%m-%d')
-            
-            cursor.execute('''
-                SELECT SUM(message_count) 
-                FROM message_stats 
-                WHERE guild_id = ? AND date = ?
-            ''', (guild.id, today))
-            today_messages = cursor.fetchone()[0] or 0
-            
-            cursor.execute('''
-                SELECT SUM(message_count) 
-                FROM message_stats 
-                WHERE guild_id = ? AND date >= date('now', '-7 days')
-            ''', (guild.id,))
-            week_messages = cursor.fetchone()[0] or 0
+            # 日・週・時間ごとの集計テーブルから読むため、履歴の量に関係なく数行で済む
+            now = datetime.now()
+            today = day_number(now.date())
+            today_messages, today_voice = await self.bot.db.get_activity_totals(guild.id, today, today)
+            week_messages, _ = await self.bot.db.get_activity_totals(guild.id, today - 6, today)
+            month_messages, _ = await self.bot.db.get_activity_totals(guild.id, today - 29, today)
+            quarter_messages, _ = await self.bot.db.get_activity_totals(guild.id, today - 83, today)
+            current_hour = today * 24 + now.hour
+            hourly = await self.bot.db.get_hourly_activity(guild.id, current_hour - 23, current_hour)
             
             embed = discord.Embed(
                 title=f"{guild.name} の統計情報",
                 color=discord.Color.blue(),
-                timestamp=datetime.datetime.now()
+                timestamp=datetime.now()
             )
             
             if guild.icon:
@@ -711,14 +816,77 @@ class AdminCog(commands.Cog):
             embed.add_field(
                 name="アクティビティ",
                 value=f"今日のメッセージ: {today_messages}\n"
-                      f"週間メッセージ: {week_messages}",
+                      f"週間メッセージ: {week_messages}\n"
+                      f"30日間のメッセージ: {month_messages}\n"
+                      f"12週間のメッセージ: {quarter_messages}\n"
+                      f"今日のVC滞在時間: {today_voice // 3600}時間{today_voice % 3600 // 60}分",
                 inline=False
             )
+
+            if hourly:
+                busiest = sorted(hourly, key=lambda row: row[1], reverse=True)[:5]
+                embed.add_field(
+                    name="直近24時間で活発な時間帯",
+                    value='\n'.join(f"{hour % 24:02d}時台: {count}件" for hour, count in busiest),
+                    inline=False
+                )
             
             await interaction.response.send_message(embed=embed)
         except Exception as e:
             self.logger.error(f"Error in serverstats: {e}")
             await interaction.response.send_message("統計情報の取得中にエラーが発生しました。", ephemeral=True)
 
+    @app_commands.command(name="exportstats", description="活動統計をファイルに書き出す")
+    @app_commands.describe(kind="書き出す統計", fmt="ファイル形式")
+    @app_commands.choices(
+        kind=[
+            app_commands.Choice(name="メッセージ数", value="messages"),
+            app_commands.Choice(name="VC滞在時間", value="voice")
+        ],
+        fmt=[
+            app_commands.Choice(name="CSV", value="csv"),
+            app_commands.Choice(name="NDJSON", value="ndjson")
+        ]
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def exportstats(self, interaction: discord.Interaction, kind: str = "messages", fmt: str = "csv"):
+        """
+        ギルドの統計をgzip圧縮したCSV/NDJSONで書き出すコマンド
+        
+        行は読み取り専用接続のワーカースレッドで少しずつ読み出して書き込むため、
+        行数が多くてもメモリ使用量やイベントループへの影響は増えない
+        """
+        if kind not in EXPORT_QUERIES:
+            await interaction.response.send_message("不明な統計の種類です。", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            guild_id = interaction.guild_id
+            out_path = os.path.join(EXPORT_DIR, export_filename(guild_id, kind, fmt))
+
+            row_count = await self.bot.db.reader.run(
+                lambda conn: write_export(conn, guild_id, kind, fmt, out_path)
+            )
+            size = os.path.getsize(out_path)
+
+            if size <= interaction.guild.filesize_limit:
+                await interaction.followup.send(
+                    f"{row_count}行を書き出しました。",
+                    file=discord.File(out_path),
+                    ephemeral=True
+                )
+                os.remove(out_path)
+            else:
+                await interaction.followup.send(
+                    f"{row_count}行を書き出しましたが、添付できるサイズを超えたためサーバー上に保存しました: `{out_path}`",
+                    ephemeral=True
+                )
+            self.logger.info(f"Exported {row_count} {kind} rows for guild {guild_id} ({size} bytes)")
+        except Exception as e:
+            self.logger.error(f"Error in exportstats: {e}")
+            await interaction.followup.send("統計の書き出し中にエラーが発生しました。", ephemeral=True)
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(AdminCog(bot))
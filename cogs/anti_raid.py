@@ -0,0 +1,353 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from discord.utils import utcnow
+from typing import Dict, List, Optional
+
+from utils.guild_settings import RaidPolicy
+from utils.sliding_window import SlidingWindowCounter
+
+# 参加を二重に数えないために覚えておく件数
+SEEN_JOINS_LIMIT = 10000
+# ロックダウン終了時のログに載せる参加者の最大数
+SUMMARY_SAMPLE_SIZE = 20
+# 低速モードの変更・タイムアウトを同時に行う数
+EDIT_CONCURRENCY = 5
+# ロックダウン前の設定を保存する config_meta のキー（再起動時に元に戻すため）
+LOCKDOWN_META_KEY = 'raid_lockdowns'
+
+class LockdownState:
+    """1ギルド分のロックダウンの状態"""
+
+    __slots__ = (
+        'started_at', 'until', 'joined', 'new_accounts', 'sample', 'previous_verification',
+        'previous_slowmode', 'ended'
+    )
+
+    def __init__(self, duration: float):
+        self.started_at = utcnow()
+        self.until = time.monotonic() + duration
+        self.joined = 0
+        self.new_accounts = 0
+        self.sample: List[int] = []
+        self.previous_verification: Optional[discord.VerificationLevel] = None
+        self.previous_slowmode: Dict[int, int] = {}
+        self.ended = asyncio.Event()
+
+class AntiRaid(commands.Cog):
+    """
+    参加レイドの検出とロックダウン
+
+    ギルドごとに直近 join_window 秒の参加数（新しいアカウントほど重い）を数え、
+    閾値を超えたら認証レベルと低速モードを引き上げる。ロックダウン中の参加ログは
+    1件ずつ送らず、終了時にまとめて1件の要約として送る。
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.logger = logging.getLogger('bot.antiraid')
+        self.join_scores = SlidingWindowCounter(max_keys=10000, idle_ttl=3600)
+        self.lockdowns: Dict[int, LockdownState] = {}
+        self._seen: 'OrderedDict[tuple, None]' = OrderedDict()
+        self._timeout_queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._lockdown_tasks: Dict[int, asyncio.Task] = {}
+        # 元に戻していないロックダウン前の設定（guild_id -> 保存用の辞書）
+        self._saved: Dict[str, dict] = {}
+        self._save_lock = asyncio.Lock()
+        self._restored = False
+
+    async def cog_load(self):
+        self._tasks.append(asyncio.create_task(self.process_timeout_queue()))
+
+    def cog_unload(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._lockdown_tasks.values():
+            task.cancel()
+
+    def _forget_task(self, guild_id: int, task: asyncio.Task):
+        if self._lockdown_tasks.get(guild_id) is task:
+            del self._lockdown_tasks[guild_id]
+
+    async def end_all_lockdowns(self):
+        """
+        すべてのロックダウンを終了し、設定を元に戻し終わるまで待つ
+
+        Botの終了処理で、HTTPセッションやDBを閉じる前に呼ぶ。
+        """
+        for state in self.lockdowns.values():
+            state.ended.set()
+        tasks = list(self._lockdown_tasks.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _save_state(self, guild_id: int, state: Optional[LockdownState]):
+        """ロックダウン前の設定を config_meta に保存する（state がNoneなら削除する）"""
+        if state is None:
+            self._saved.pop(str(guild_id), None)
+        else:
+            self._saved[str(guild_id)] = {
+                'verification_level': state.previous_verification.name if state.previous_verification else None,
+                'slowmode': {str(channel_id): delay for channel_id, delay in state.previous_slowmode.items()},
+            }
+        store = self.bot.config_manager.store
+        async with self._save_lock:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, store.set_meta, LOCKDOWN_META_KEY, json.dumps(self._saved)
+                )
+            except Exception as e:
+                self.logger.error(f"ロックダウンの状態を保存できませんでした（ギルド: {guild_id}）: {e}")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """前回の終了時に元に戻せなかったロックダウンの設定を戻す"""
+        if self._restored:
+            return
+        self._restored = True
+        store = self.bot.config_manager.store
+        try:
+            value = await asyncio.get_running_loop().run_in_executor(None, store.get_meta, LOCKDOWN_META_KEY)
+            saved = json.loads(value) if value else {}
+        except Exception as e:
+            self.logger.error(f"ロックダウンの状態を読み込めませんでした: {e}")
+            return
+
+        for guild_id, data in saved.items():
+            guild = self.bot.get_guild(int(guild_id))
+            if guild is None or guild.id in self.lockdowns:
+                continue
+            state = LockdownState(0)
+            level = data.get('verification_level')
+            state.previous_verification = getattr(discord.VerificationLevel, level) if level else None
+            state.previous_slowmode = {int(channel_id): delay for channel_id, delay in data.get('slowmode', {}).items()}
+            self._saved[guild_id] = data
+            await self.release_lockdown(guild, state)
+            await self._save_state(guild.id, None)
+            self.logger.info(f"前回終了時のロックダウンの設定を元に戻しました（ギルド: {guild.id}）")
+
+    def get_policy(self, guild_id: int) -> RaidPolicy:
+        return self.bot.config_manager.get_settings(guild_id).raid
+
+    @staticmethod
+    def join_weight(member: discord.Member, policy: RaidPolicy) -> int:
+        """参加1件の重み（作成1日未満: 3、new_account_days 日未満: 2、それ以外: 1）"""
+        age = utcnow() - member.created_at
+        if age < timedelta(days=1):
+            return 3
+        if age < timedelta(days=policy.new_account_days):
+            return 2
+        return 1
+
+    def observe(self, member: discord.Member) -> bool:
+        """
+        参加を記録し、必要ならロックダウンを開始する
+
+        同じ参加について何度呼ばれても1回しか数えない（MemberLogging と自身のリスナーの両方から呼ばれる）。
+        イベントループを止めないよう、Discord APIの呼び出しはすべてバックグラウンドで行う。
+
+        Returns
+        -------
+        bool
+            ロックダウン中で、参加ログを個別に送るべきでない場合はTrue
+        """
+        guild = member.guild
+        key = (guild.id, member.id, member.joined_at)
+        if key in self._seen:
+            return guild.id in self.lockdowns
+        self._seen[key] = None
+        if len(self._seen) > SEEN_JOINS_LIMIT:
+            self._seen.popitem(last=False)
+
+        policy = self.get_policy(guild.id)
+        if not policy.enabled:
+            return False
+
+        weight = self.join_weight(member, policy)
+        score = self.join_scores.hit(guild.id, policy.join_window, weight)
+        state = self.lockdowns.get(guild.id)
+        if state is None:
+            if score < policy.join_threshold:
+                return False
+            state = self.lockdowns[guild.id] = LockdownState(policy.lockdown_duration)
+            task = self._lockdown_tasks[guild.id] = asyncio.create_task(self.run_lockdown(guild, state, policy))
+            task.add_done_callback(lambda done, guild_id=guild.id: self._forget_task(guild_id, done))
+        elif score >= policy.join_threshold:
+            # 参加が続いている間はロックダウンを延長する
+            state.until = time.monotonic() + policy.lockdown_duration
+
+        state.joined += 1
+        if weight > 1:
+            state.new_accounts += 1
+        if len(state.sample) < SUMMARY_SAMPLE_SIZE:
+            state.sample.append(member.id)
+        if policy.timeout_joiners:
+            self._timeout_queue.put_nowait((member, policy.timeout_duration))
+        return True
+
+    async def send_log(self, guild_id: int, embed: discord.Embed):
+        logging_cog = self.bot.get_cog('LoggingCog')
+        if logging_cog is not None:
+            await logging_cog.send_log(guild_id, embed)
+
+    async def run_lockdown(self, guild: discord.Guild, state: LockdownState, policy: RaidPolicy):
+        """ロックダウンを適用し、参加が落ち着いたら元に戻す"""
+        try:
+            await self.apply_lockdown(guild, state, policy)
+            await self._save_state(guild.id, state)
+
+            embed = discord.Embed(
+                title="参加レイドを検出しました",
+                description=(
+                    f"{policy.join_window}秒間の参加が閾値（{policy.join_threshold}）を超えたため、"
+                    "ロックダウンを開始しました。"
+                ),
+                color=discord.Color.red(),
+                timestamp=state.started_at
+            )
+            embed.add_field(name="認証レベル", value=str(guild.verification_level), inline=True)
+            if policy.slowmode:
+                embed.add_field(name="低速モード", value=f"{policy.slowmode}秒", inline=True)
+            await self.send_log(guild.id, embed)
+
+            while True:
+                remaining = state.until - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(state.ended.wait(), timeout=remaining)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        except Exception as e:
+            self.logger.error(f"ロックダウン中にエラーが発生しました（ギルド: {guild.id}）: {e}")
+        finally:
+            # キャンセルされた場合（Cogのアンロード時など）も設定は元に戻し、要約は送らずにキャンセルを伝える
+            self.lockdowns.pop(guild.id, None)
+            await self.release_lockdown(guild, state)
+            await self._save_state(guild.id, None)
+
+        embed = discord.Embed(
+            title="ロックダウン終了",
+            color=discord.Color.green(),
+            timestamp=utcnow()
+        )
+        embed.add_field(name="期間中の参加者", value=f"{state.joined}人", inline=True)
+        embed.add_field(name="新しいアカウント", value=f"{state.new_accounts}人", inline=True)
+        if state.sample:
+            sample = ' '.join(f"<@{member_id}>" for member_id in state.sample)
+            if state.joined > len(state.sample):
+                sample += f" 他{state.joined - len(state.sample)}人"
+            embed.add_field(name="参加者", value=sample[:1024], inline=False)
+        await self.send_log(guild.id, embed)
+
+    async def apply_lockdown(self, guild: discord.Guild, state: LockdownState, policy: RaidPolicy):
+        target = getattr(discord.VerificationLevel, policy.verification_level)
+        if guild.verification_level < target:
+            try:
+                state.previous_verification = guild.verification_level
+                await guild.edit(verification_level=target, reason="Raid lockdown")
+            except discord.HTTPException as e:
+                state.previous_verification = None
+                self.logger.warning(f"認証レベルを変更できませんでした（ギルド: {guild.id}）: {e}")
+
+        if policy.slowmode:
+            channels = [c for c in guild.text_channels if c.slowmode_delay < policy.slowmode]
+            await self._edit_slowmode(channels, lambda channel: policy.slowmode, state.previous_slowmode)
+
+    async def release_lockdown(self, guild: discord.Guild, state: LockdownState):
+        if state.previous_verification is not None:
+            try:
+                await guild.edit(verification_level=state.previous_verification, reason="Raid lockdown ended")
+            except discord.HTTPException as e:
+                self.logger.warning(f"認証レベルを戻せませんでした（ギルド: {guild.id}）: {e}")
+
+        channels = [c for c in (guild.get_channel(cid) for cid in state.previous_slowmode) if c is not None]
+        await self._edit_slowmode(channels, lambda channel: state.previous_slowmode[channel.id], None)
+
+    async def _edit_slowmode(self, channels, delay_for, previous: Optional[Dict[int, int]]):
+        """チャンネルの低速モードを並行して変更する（previous には変更前の値を記録する）"""
+        semaphore = asyncio.Semaphore(EDIT_CONCURRENCY)
+
+        async def edit(channel: discord.TextChannel):
+            async with semaphore:
+                before = channel.slowmode_delay
+                try:
+                    await channel.edit(slowmode_delay=delay_for(channel), reason="Raid lockdown")
+                    if previous is not None:
+                        previous[channel.id] = before
+                except discord.HTTPException as e:
+                    self.logger.warning(f"低速モードを変更できませんでした（チャンネル: {channel.id}）: {e}")
+
+        await asyncio.gather(*(edit(channel) for channel in channels))
+
+    async def process_timeout_queue(self):
+        """ロックダウン中の参加者をまとめてタイムアウトする"""
+        semaphore = asyncio.Semaphore(EDIT_CONCURRENCY)
+
+        async def timeout(member: discord.Member, seconds: int):
+            async with semaphore:
+                try:
+                    await member.timeout(timedelta(seconds=seconds), reason="Raid lockdown")
+                except discord.HTTPException as e:
+                    self.logger.warning(f"参加者をタイムアウトできませんでした（{member.id}）: {e}")
+
+        while True:
+            batch = [await self._timeout_queue.get()]
+            while not self._timeout_queue.empty():
+                batch.append(self._timeout_queue.get_nowait())
+            await asyncio.gather(*(timeout(member, seconds) for member, seconds in batch))
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.observe(member)
+
+    @app_commands.command(name="raidstatus", description="参加レイド対策の設定と状態を表示")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.guild_only()
+    async def raid_status(self, interaction: discord.Interaction):
+        policy = self.get_policy(interaction.guild_id)
+        state = self.lockdowns.get(interaction.guild_id)
+        embed = discord.Embed(
+            title="参加レイド対策",
+            color=discord.Color.red() if state else discord.Color.blue(),
+            timestamp=utcnow()
+        )
+        embed.add_field(name="状態", value="ロックダウン中" if state else ("監視中" if policy.enabled else "無効"), inline=False)
+        embed.add_field(
+            name="閾値",
+            value=f"{policy.join_window}秒間に{policy.join_threshold}（作成{policy.new_account_days}日未満のアカウントは重み2以上）",
+            inline=False
+        )
+        embed.add_field(name="ロックダウン時の認証レベル", value=policy.verification_level, inline=True)
+        embed.add_field(name="低速モード", value=f"{policy.slowmode}秒" if policy.slowmode else "変更しない", inline=True)
+        embed.add_field(
+            name="参加者のタイムアウト",
+            value=f"{policy.timeout_duration}秒" if policy.timeout_joiners else "しない",
+            inline=True
+        )
+        if state:
+            remaining = max(int(state.until - time.monotonic()), 0)
+            embed.add_field(name="期間中の参加者", value=f"{state.joined}人（残り{remaining}秒）", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="endlockdown", description="参加レイドのロックダウンを解除")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.guild_only()
+    async def end_lockdown(self, interaction: discord.Interaction):
+        state = self.lockdowns.get(interaction.guild_id)
+        if state is None:
+            await interaction.response.send_message("ロックダウン中ではありません。", ephemeral=True)
+            return
+        state.ended.set()
+        await interaction.response.send_message("ロックダウンを解除します。", ephemeral=True)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(AntiRaid(bot))
@@ -5,188 +5,450 @@ import re
 import asyncio
 from collections import defaultdict
 import datetime
-import os
 from discord.utils import utcnow
-from typing import List
+from typing import Dict, List, Optional, Tuple
+
+from utils.attachment_fingerprint import AttachmentFingerprinter
+from utils.fingerprint import FingerprintStore, content_hash, normalize_text
+from utils.guild_settings import SPAM_WINDOW_LIMITS, SpamPolicy
+from utils.recent_messages import RecentMessageIndex
+from utils.sliding_window import SlidingWindowCounter
+
+# スパム対処後、同じユーザーへの対処を繰り返さない期間（秒）
+ACTION_COOLDOWN = 600
+# 削除対象を引くために投稿を記録しておく期間（秒）。purge_window がこれより長い場合は履歴を取得する
+RECENT_INDEX_RETENTION = 3600
+# 削除キューから取り出したあと、同時に削除するメッセージが溜まるのを待つ時間（秒）
+DELETE_BATCH_DELAY = 0.5
+# 一括削除1回あたりの最大件数
+BULK_DELETE_LIMIT = 100
+# 同時に削除処理を行うチャンネル数
+DELETE_CONCURRENCY = 4
+# 同じ・ほぼ同じ本文を数える期間（秒）
+DUPLICATE_TTL = 60
+# この数以上のチャンネル（別サーバーを含む）に同じ本文が投稿されたらスパムとみなす
+DUPLICATE_CHANNEL_THRESHOLD = 3
+# 同じユーザーが同じ本文をこの回数以上投稿したら、チャンネル数に関係なくそのユーザーをスパムとみなす
+DUPLICATE_COPY_THRESHOLD = 5
+# 重複判定の対象にする本文の最小文字数（正規化後）。短い挨拶などを誤検出しないため
+MIN_FINGERPRINT_LENGTH = 20
+# 重複判定の対象にする添付ファイルの最小サイズ（バイト）。小さなスタンプ画像などを誤検出しないため
+MIN_ATTACHMENT_SIZE = 4096
+# BAN時にDiscordが削除できるメッセージの期間の上限（7日）
+MAX_BAN_DELETE_SECONDS = 7 * 24 * 60 * 60
+
+def format_duration(seconds: int) -> str:
+    """秒数を「30分」「1時間30分」のような表記にする"""
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours}時間")
+    if minutes:
+        parts.append(f"{minutes}分")
+    if secs or not parts:
+        parts.append(f"{secs}秒")
+    return ''.join(parts)
 
 class AntiSpam(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.message_history = defaultdict(list)
+        # (guild_id, user_id) ごとの直近のメッセージとスパム対処の記録
+        # time_window は SPAM_WINDOW_LIMITS 以下なので、それより長く発言のないユーザーの記録は不要
+        self.message_history = SlidingWindowCounter(idle_ttl=SPAM_WINDOW_LIMITS['time_window'])
         self.warning_counts = defaultdict(int)
-        self.timeout_history = defaultdict(list)
+        self.timeout_history = SlidingWindowCounter(idle_ttl=ACTION_COOLDOWN)
+        # (guild_id, user_id) ごとの直近のメンション数（メッセージをまたいで数える）
+        self.mention_history = SlidingWindowCounter(idle_ttl=SPAM_WINDOW_LIMITS['mention_window'])
+        # (guild_id, user_id) ごとの直近の投稿。これより前の投稿は履歴から探す
+        self.recent_messages = RecentMessageIndex(retention=RECENT_INDEX_RETENTION)
+        self.started_at = utcnow()
+        # 本文の指紋。Botが参加している全サーバーで共有する
+        self.fingerprints = FingerprintStore(ttl=DUPLICATE_TTL)
+        # 添付ファイルの指紋。メタデータが衝突した場合だけ共有のHTTPセッションで先頭を取得する
+        self.attachment_fingerprints = AttachmentFingerprinter(bot.http_session, ttl=DUPLICATE_TTL)
         self.allowed_roles = [
             1305109844436713512,
             1004989482069676092,
             1318091880650641438,
             981550654382280714
         ]
-        self.spam_threshold = 5
-        self.spam_timeframe = 5
         self.max_mentions = 5
         self.max_warnings = 3
         self.message_delete_queue = asyncio.Queue()
+        self._delete_semaphore = asyncio.Semaphore(DELETE_CONCURRENCY)
         
         # ログディレクトリの作成
         self.log_dir = "logs/spam"
-        os.makedirs(self.log_dir, exist_ok=True)
+        # スパム対処の記録（logs/spam/incidents.ndjson）。Botの終了時に書き込みを終えてから閉じる
+        self.journal = bot.incident_journal
         
         # タスクの開始
         self.bot.loop.create_task(self.cleanup_cache())
         self.bot.loop.create_task(self.process_delete_queue())
 
-    def is_recently_timeout(self, user_id: int) -> bool:
+    def is_recently_timeout(self, guild_id: int, user_id: int) -> bool:
         """ユーザーが最近タイムアウトされたかチェック"""
-        current_time = utcnow()
-        recent_timeouts = [
-            timestamp for timestamp in self.timeout_history[user_id]
-            if (current_time - timestamp).total_seconds() < 600  # 10分
-        ]
-        self.timeout_history[user_id] = recent_timeouts
-        return len(recent_timeouts) > 0
+        return self.timeout_history.count((guild_id, user_id), ACTION_COOLDOWN) > 0
 
-    async def save_spam_log(self, messages: List[discord.Message], user_id: int):
-        """スパムメッセージをログファイルに保存"""
-        current_time = utcnow()
-        filename = f"{self.log_dir}/spam_detected_{current_time.strftime('%Y%m%d_%H%M%S')}_{user_id}.txt"
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(f"Spam Detection Log\n")
-            f.write(f"User ID: {user_id}\n")
-            f.write(f"Detection Time: {current_time}\n")
-            f.write(f"Message Count: {len(messages)}\n")
-            f.write("-" * 50 + "\n\n")
-            
-            for msg in sorted(messages, key=lambda x: x.created_at):
-                f.write(f"Time: {msg.created_at}\n")
-                f.write(f"Channel: #{msg.channel.name}\n")
-                f.write(f"Content: {msg.content}\n")
-                if msg.attachments:
-                    f.write(f"Attachments: {len(msg.attachments)} files\n")
-                f.write("-" * 50 + "\n")
-
-    async def handle_spam(self, message: discord.Message):
+    def record_incident(self, message: discord.Message, messages: list, action: str, reason: str,
+                        content_hashes: Optional[Dict[int, Optional[int]]] = None):
+        """
+        スパム対処の記録をジャーナルに追加する（書き込みはバックグラウンドで行う）
+
+        本文を持たない PartialMessage のハッシュは content_hashes（message_id -> ハッシュ）から引く。
+        """
+        content_hashes = content_hashes or {}
+        self.journal.record({
+            'guild_id': message.guild.id,
+            'user_id': message.author.id,
+            'user': str(message.author),
+            'reason': reason,
+            'action': action,
+            'message_count': len(messages),
+            'message_ids': [msg.id for msg in messages],
+            'channel_ids': sorted({msg.channel.id for msg in messages}),
+            # 本文が分からないメッセージはNone
+            'content_hashes': [self._journal_hash(msg, content_hashes) for msg in messages],
+        })
+
+    @staticmethod
+    def _journal_hash(msg, content_hashes: Dict[int, Optional[int]]) -> Optional[str]:
+        content = getattr(msg, 'content', None)
+        digest = content_hash(normalize_text(content)) if content else content_hashes.get(msg.id)
+        return f"{digest:016x}" if digest is not None else None
+
+    @staticmethod
+    def _content_hash(message: discord.Message) -> Optional[int]:
+        return content_hash(normalize_text(message.content)) if message.content else None
+
+    def get_policy(self, guild_id: int) -> SpamPolicy:
+        """
+        ギルドのスパム対策設定を取得する
+
+        GuildSettings は設定変更時にだけ作り直されるため、メッセージごとの参照はO(1)で済む。
+        """
+        return self.bot.config_manager.get_settings(guild_id).spam
+
+    async def handle_spam(self, message: discord.Message, policy: SpamPolicy, reason: str = 'rate'):
         user_id = message.author.id
+        key = (message.guild.id, user_id)
         
         # 既にタイムアウト中なら追加の処理をスキップ
-        if self.is_recently_timeout(user_id):
+        if self.is_recently_timeout(*key):
             return
 
         # タイムアウト履歴を記録
         current_time = utcnow()
-        self.timeout_history[user_id].append(current_time)
-        
-        # 過去10分間のメッセージを収集して削除キューに追加
-        ten_minutes_ago = current_time - datetime.timedelta(minutes=10)
-        spam_messages = []
-        deleted_count = 0
-        
+        self.timeout_history.hit(key, ACTION_COOLDOWN)
+        # サーバーをまたいだ評判に反映
+        await self.bot.reputation.record_incident(user_id, message.guild.id)
+        self.message_history.reset(key)
+        self.mention_history.reset(key)
+
         try:
-            # まず現在のメッセージを削除キューに追加
+            if policy.action == 'ban':
+                # BANはDiscord側で直近のメッセージも削除されるため、収集は行わない
+                self.record_incident(message, [message], policy.action, reason)
+                await self.apply_ban(message, policy)
+                return
+
+            # 設定された期間のメッセージを記録から収集する
+            purge_after = current_time - datetime.timedelta(seconds=policy.purge_window)
+            spam_messages, content_hashes = self.collect_recent_messages(message, policy.purge_window)
+            self.recent_messages.pop(key)
+
+            # 記録が対象期間をすべて含んでいない場合（起動直後など）だけ、足りない期間の履歴を取得する
+            covered_since = max(
+                self.started_at, current_time - datetime.timedelta(seconds=RECENT_INDEX_RETENTION)
+            )
+            if purge_after < covered_since:
+                known_ids = {msg.id for msg in spam_messages}
+                for msg in await self.scan_history(message, purge_after, covered_since):
+                    if msg.id not in known_ids:
+                        spam_messages.append(msg)
+
+            # 現在のメッセージと収集したメッセージを削除キューに追加
             await self.message_delete_queue.put(message)
-            deleted_count += 1
+            for msg in spam_messages:
+                await self.message_delete_queue.put(msg)
+            deleted_count = len(spam_messages) + 1
 
-            # 他のチャンネルのメッセージを収集
-            for channel in message.guild.text_channels:
-                try:
-                    async for msg in channel.history(after=ten_minutes_ago, limit=None):
-                        if msg.author.id == user_id and msg.id != message.id:
-                            spam_messages.append(msg)
-                            await self.message_delete_queue.put(msg)
-                            deleted_count += 1
-                            # レート制限を避けるため、10メッセージごとに少し待機
-                            if deleted_count % 10 == 0:
-                                await asyncio.sleep(2)
-                except discord.Forbidden:
-                    continue
-                except Exception as e:
-                    print(f"Error in channel {channel.name}: {e}")
-                    continue
+            # スパム対処をジャーナルに記録
+            self.record_incident(message, [message] + spam_messages, policy.action, reason, content_hashes)
 
-            # スパムメッセージをログに記録
-            await self.save_spam_log(spam_messages, user_id)
-            
-            # ユーザーをタイムアウト
-            try:
-                # タイムアウトの終了時刻を設定（UTCで）
-                timeout_end = current_time + datetime.timedelta(minutes=30)
-                await message.author.timeout(timeout_end, reason="Spam detection")
-                
+            if policy.action == 'timeout':
+                await self.apply_timeout(message, policy, deleted_count)
+            else:
                 await message.channel.send(
                     f"{message.author.mention} のスパムを検出しました。\n"
-                    f"{deleted_count}件のメッセージを削除し、30分間のタイムアウトを適用しました。",
+                    f"{deleted_count}件のメッセージを削除しました。",
                     delete_after=30
                 )
-            except discord.Forbidden:
-                await message.channel.send("タイムアウト処理に必要な権限がありません。", delete_after=10)
-            except Exception as e:
-                print(f"Error in timeout process: {e}")
                 
         except Exception as e:
             print(f"Error in spam handling: {e}")
 
+    def collect_recent_messages(self, message: discord.Message,
+                                window: float) -> Tuple[list, Dict[int, Optional[int]]]:
+        """
+        記録からユーザーの直近 window 秒のメッセージを集める（APIは呼ばない）
+
+        削除に使う PartialMessage のリストと、記録時に控えた本文のハッシュ（message_id -> ハッシュ）を返す。
+        参照するのは記録にある件数分だけで、Botのメッセージキャッシュは走査しない。
+        """
+        messages = []
+        content_hashes = {}
+        recent = self.recent_messages.recent((message.guild.id, message.author.id), window)
+        for channel_id, message_id, digest in recent:
+            if message_id == message.id:
+                continue
+            channel = message.guild.get_channel_or_thread(channel_id)
+            if channel is None or not hasattr(channel, 'get_partial_message'):
+                continue
+            messages.append(channel.get_partial_message(message_id))
+            content_hashes[message_id] = digest
+        return messages, content_hashes
+
+    async def scan_history(self, message: discord.Message, after: datetime.datetime,
+                           before: datetime.datetime) -> list:
+        """記録のない期間について、全チャンネルの履歴からユーザーのメッセージを探す"""
+        user_id = message.author.id
+        found = []
+        for channel in message.guild.text_channels:
+            try:
+                async for msg in channel.history(after=after, before=before, limit=None):
+                    if msg.author.id == user_id and msg.id != message.id:
+                        found.append(msg)
+                        # レート制限を避けるため、10メッセージごとに少し待機
+                        if len(found) % 10 == 0:
+                            await asyncio.sleep(2)
+            except discord.Forbidden:
+                continue
+            except Exception as e:
+                print(f"Error in channel {channel.name}: {e}")
+                continue
+        return found
+
+    async def apply_timeout(self, message: discord.Message, policy: SpamPolicy, deleted_count: int):
+        """設定された期間のタイムアウトを適用する"""
+        try:
+            await message.author.timeout(
+                datetime.timedelta(seconds=policy.timeout_duration), reason="Spam detection"
+            )
+            await message.channel.send(
+                f"{message.author.mention} のスパムを検出しました。\n"
+                f"{deleted_count}件のメッセージを削除し、{format_duration(policy.timeout_duration)}のタイムアウトを適用しました。",
+                delete_after=30
+            )
+        except discord.Forbidden:
+            await message.channel.send("タイムアウト処理に必要な権限がありません。", delete_after=10)
+        except Exception as e:
+            print(f"Error in timeout process: {e}")
+
+    async def apply_ban(self, message: discord.Message, policy: SpamPolicy):
+        """ユーザーをBANし、直近のメッセージをDiscord側で削除させる"""
+        try:
+            await message.guild.ban(
+                message.author,
+                reason="Spam detection",
+                delete_message_seconds=min(policy.purge_window, MAX_BAN_DELETE_SECONDS)
+            )
+            await message.channel.send(
+                f"{message.author.mention} のスパムを検出したため、BANしました。",
+                delete_after=30
+            )
+        except discord.Forbidden:
+            await message.channel.send("BAN処理に必要な権限がありません。", delete_after=10)
+        except Exception as e:
+            print(f"Error in ban process: {e}")
+
     async def process_delete_queue(self):
+        """
+        削除キューをチャンネルごとにまとめて処理する
+
+        最初の1件を受け取ったら DELETE_BATCH_DELAY 秒だけ待って溜まった分をまとめて取り出し、
+        チャンネルごとに一括削除（100件ずつ、14日以内のもの）を並行して行う。
+        """
         while True:
             try:
-                message = await self.message_delete_queue.get()
-                retry_count = 0
-                max_retries = 3
-                
-                while retry_count < max_retries:
-                    try:
-                        await message.delete()
-                        break  # 成功したらループを抜ける
-                    except discord.NotFound:
-                        break  # メッセージが既に削除されている場合
-                    except discord.Forbidden:
-                        break  # 権限がない場合
-                    except discord.HTTPException as e:
-                        if e.code == 429:  # Rate limit
-                            retry_after = e.retry_after if hasattr(e, 'retry_after') else 5
-                            print(f"Rate limited, waiting {retry_after} seconds...")
-                            await asyncio.sleep(retry_after)
-                            retry_count += 1
-                        else:
-                            break
-                    except Exception as e:
-                        print(f"Unexpected error in delete process: {e}")
-                        break
-                    
-                    await asyncio.sleep(2)  # 各試行の間に待機
-                
-                self.message_delete_queue.task_done()
-                await asyncio.sleep(1)  # キュー処理の間隔
-                
+                batch = [await self.message_delete_queue.get()]
+                await asyncio.sleep(DELETE_BATCH_DELAY)
+                while not self.message_delete_queue.empty():
+                    batch.append(self.message_delete_queue.get_nowait())
+
+                by_channel = defaultdict(list)
+                for message in batch:
+                    by_channel[message.channel.id].append(message)
+
+                try:
+                    await asyncio.gather(*(
+                        self.delete_channel_messages(messages[0].channel, messages)
+                        for messages in by_channel.values()
+                    ))
+                finally:
+                    for _ in batch:
+                        self.message_delete_queue.task_done()
+
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 print(f"Error in delete queue processing: {e}")
                 await asyncio.sleep(2)
 
+    async def delete_channel_messages(self, channel, messages: list):
+        """1チャンネル分のメッセージを削除する（同時に処理するチャンネル数は制限する）"""
+        async with self._delete_semaphore:
+            # 一括削除できるのは14日以内のメッセージのみ（境界付近は余裕を持たせる）
+            bulk_limit = utcnow() - datetime.timedelta(days=14) + datetime.timedelta(minutes=5)
+            unique = {message.id: message for message in messages}
+            recent = [m for m in unique.values() if m.created_at > bulk_limit]
+            old = [m for m in unique.values() if m.created_at <= bulk_limit]
+
+            for i in range(0, len(recent), BULK_DELETE_LIMIT):
+                chunk = recent[i:i + BULK_DELETE_LIMIT]
+                if len(chunk) == 1 or not hasattr(channel, 'delete_messages'):
+                    old.extend(chunk)
+                    continue
+                if not await self._with_rate_limit_retry(lambda: channel.delete_messages(chunk)):
+                    # 一括削除に失敗した場合は1件ずつ削除する
+                    old.extend(chunk)
+
+            for message in old:
+                await self._with_rate_limit_retry(message.delete)
+
+    async def _with_rate_limit_retry(self, request, max_retries: int = 3) -> bool:
+        """
+        削除リクエストを実行する。レート制限の場合は指定された時間だけ待って再試行する
+
+        Returns
+        -------
+        bool
+            削除できた（または既に削除済み・権限なしで再試行不要）ならTrue、
+            一括削除をやめて1件ずつ削除すべきならFalse
+        """
+        for attempt in range(max_retries):
+            try:
+                await request()
+                return True
+            except (discord.NotFound, discord.Forbidden):
+                return True
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == max_retries - 1:
+                    print(f"Error deleting messages: {e}")
+                    return False
+                retry_after = getattr(e, 'retry_after', None) or 5
+                print(f"Rate limited, waiting {retry_after} seconds...")
+                await asyncio.sleep(retry_after)
+            except Exception as e:
+                print(f"Unexpected error in delete process: {e}")
+                return False
+        return False
+
     async def cleanup_cache(self):
         while True:
             await asyncio.sleep(300)  # 5分ごとに実行
-            current_time = utcnow()
-            for user_id in list(self.message_history.keys()):
-                self.message_history[user_id] = [
-                    timestamp for timestamp in self.message_history[user_id]
-                    if (current_time - timestamp).total_seconds() < self.spam_timeframe
-                ]
+            # しばらく発言のないユーザーの記録を削除
+            self.message_history.sweep()
+            self.timeout_history.sweep()
+            self.mention_history.sweep()
+            self.recent_messages.sweep()
 
     def has_allowed_role(self, member: discord.Member) -> bool:
         """許可されたロールを持っているかチェック"""
         return any(role.id in self.allowed_roles for role in member.roles)
 
-    async def check_spam(self, message: discord.Message) -> bool:
-        """スパムチェック"""
-        user_id = message.author.id
-        current_time = utcnow()
-        
-        self.message_history[user_id].append(current_time)
-        self.message_history[user_id] = [
-            timestamp for timestamp in self.message_history[user_id]
-            if (current_time - timestamp).total_seconds() < self.spam_timeframe
-        ]
-        
-        return len(self.message_history[user_id]) >= self.spam_threshold
+    async def check_spam(self, message: discord.Message, policy: SpamPolicy) -> bool:
+        """
+        スパムチェック（policy.time_window 秒間に policy.message_count 件以上）
+
+        他のサーバーを含めて最近スパム対処を受けたユーザーは、評判に応じて件数の閾値を下げる。
+        """
+        key = (message.guild.id, message.author.id)
+        threshold = self.bot.reputation.tightened(policy.message_count, message.author.id)
+        return self.message_history.hit(key, policy.time_window) >= threshold
+
+    @staticmethod
+    def count_mentions(message: discord.Message) -> int:
+        """メッセージ内のメンション（ユーザー・ロール・@everyone/@here）の数。権限がなく通知されない試みも数える"""
+        count = len(set(message.raw_mentions)) + len(set(message.raw_role_mentions))
+        if '@everyone' in message.content or '@here' in message.content:
+            count += 1
+        return count
+
+    def check_mention_budget(self, message: discord.Message, policy: SpamPolicy) -> bool:
+        """
+        メンション数のチェック（policy.mention_window 秒間に policy.mention_limit 以上）
+
+        1メッセージあたりのメンションが少なくても、複数のメッセージに分けた大量のメンションを検出する。
+        """
+        mentions = self.count_mentions(message)
+        if not mentions:
+            return False
+        key = (message.guild.id, message.author.id)
+        threshold = self.bot.reputation.tightened(policy.mention_limit, message.author.id)
+        return self.mention_history.hit(key, policy.mention_window, mentions) >= threshold
+
+    def check_duplicate_content(self, message: discord.Message) -> List[discord.Message]:
+        """
+        同じ・ほぼ同じ本文が複数のチャンネルやサーバーに投稿されていないかチェック
+
+        Returns
+        -------
+        List[discord.Message]
+            閾値を超えた場合、対処するユーザーごとの最新のメッセージ（超えていなければ空）
+        """
+        normalized = normalize_text(message.content)
+        if len(normalized) < MIN_FINGERPRINT_LENGTH:
+            return []
+
+        cluster = self.fingerprints.add(
+            normalized, message.guild.id, message.channel.id, message.author.id, message
+        )
+        return self._duplicate_offenders(cluster.occurrences, message)
+
+    async def check_duplicate_attachments(self, message: discord.Message) -> List[discord.Message]:
+        """
+        同じ添付ファイルが本文を変えて複数のチャンネルやサーバーに投稿されていないかチェック
+
+        Returns
+        -------
+        List[discord.Message]
+            閾値を超えた場合、対処するユーザーごとの最新のメッセージ（超えていなければ空）
+        """
+        keys = set()
+        for attachment in message.attachments:
+            if attachment.size >= MIN_ATTACHMENT_SIZE:
+                keys.add(await self.attachment_fingerprints.fingerprint(attachment))
+
+        for key in keys:
+            occurrences = self.attachment_fingerprints.record(
+                key, message.guild.id, message.channel.id, message.author.id, message
+            )
+            offenders = self._duplicate_offenders(occurrences, message)
+            if offenders:
+                return offenders
+        return []
+
+    @staticmethod
+    def _duplicate_offenders(occurrences, message: discord.Message) -> List[discord.Message]:
+        """
+        同じ内容の出現記録から、スパムとして対処するユーザーごとの最新のメッセージを取り出す
+
+        DUPLICATE_CHANNEL_THRESHOLD 以上のチャンネルに広がっていれば関わった全員を、
+        1つのチャンネル内の繰り返しなら投稿者本人の投稿が DUPLICATE_COPY_THRESHOLD 回以上の場合だけ本人を対象にする
+        （複数人が同じ文を順に書き込むチャットの流れを巻き込まないため）。
+        """
+        channels = {channel_id for _, _, channel_id, _, _ in occurrences}
+        if len(channels) < DUPLICATE_CHANNEL_THRESHOLD:
+            author = (message.guild.id, message.author.id)
+            copies = sum(1 for _, guild_id, _, user_id, _ in occurrences if (guild_id, user_id) == author)
+            return [message] if copies >= DUPLICATE_COPY_THRESHOLD else []
+
+        latest = {}
+        for _, guild_id, _, user_id, msg in occurrences:
+            latest[(guild_id, user_id)] = msg
+        return list(latest.values())
 
     def contains_invite_link(self, content: str) -> bool:
         """招待リンクを含むかチェック"""
@@ -202,6 +464,11 @@ class AntiSpam(commands.Cog):
         if isinstance(message.author, discord.Member) and self.has_allowed_role(message.author):
             return
 
+        # スパム検出時の削除対象として投稿を記録
+        self.recent_messages.add(
+            (message.guild.id, message.author.id), message.channel.id, message.id, self._content_hash(message)
+        )
+
         if self.contains_invite_link(message.content):
             try:
                 await message.delete()
@@ -213,8 +480,27 @@ class AntiSpam(commands.Cog):
             except discord.NotFound:
                 pass
 
-        if await self.check_spam(message):
-            await self.handle_spam(message)
+        policy = self.get_policy(message.guild.id)
+        if await self.check_spam(message, policy):
+            await self.handle_spam(message, policy)
+            return
+
+        duplicates = self.check_duplicate_content(message)
+        if duplicates:
+            # 同じ本文を投稿したユーザーをそれぞれのサーバーの設定で処理する
+            for msg in duplicates:
+                await self.handle_spam(msg, self.get_policy(msg.guild.id), reason='duplicate')
+            return
+
+        if message.attachments:
+            duplicates = await self.check_duplicate_attachments(message)
+            if duplicates:
+                for msg in duplicates:
+                    await self.handle_spam(msg, self.get_policy(msg.guild.id), reason='attachment')
+                return
+
+        if self.check_mention_budget(message, policy):
+            await self.handle_spam(message, policy, reason='mention')
             return
 
         if len(message.mentions) > self.max_mentions:
@@ -231,6 +517,8 @@ class AntiSpam(commands.Cog):
     @app_commands.default_permissions(administrator=True)
     async def spam_settings(self, interaction: discord.Interaction):
         """現在のスパム対策設定を表示します"""
+        policy = self.get_policy(interaction.guild_id)
+        action_names = {'timeout': 'タイムアウト', 'delete': 'メッセージ削除のみ', 'ban': 'BAN'}
         embed = discord.Embed(
             title="スパム対策設定",
             color=discord.Color.blue(),
@@ -239,25 +527,41 @@ class AntiSpam(commands.Cog):
         
         embed.add_field(
             name="スパム判定閾値",
-            value=f"{self.spam_timeframe}秒間に{self.spam_threshold}メッセージ",
+            value=f"{policy.time_window}秒間に{policy.message_count}メッセージ",
             inline=False
         )
         embed.add_field(
             name="最大メンション数",
-            value=f"1メッセージあたり{self.max_mentions}人まで",
+            value=(
+                f"1メッセージあたり{self.max_mentions}人まで、"
+                f"{format_duration(policy.mention_window)}間に合計{policy.mention_limit}件まで"
+            ),
             inline=False
         )
         embed.add_field(
-            name="タイムアウト期間",
-            value="30分",
+            name="対処",
+            value=action_names[policy.action],
             inline=False
         )
+        if policy.action == 'timeout':
+            embed.add_field(
+                name="タイムアウト期間",
+                value=format_duration(policy.timeout_duration),
+                inline=False
+            )
         embed.add_field(
             name="メッセージ削除期間",
-            value="過去10分間",
+            value=f"過去{format_duration(policy.purge_window)}間",
             inline=False
         )
         
+        history = self.message_history.stats()
+        embed.add_field(
+            name="追跡中のユーザー",
+            value=f"{history['keys']}件（上限{history['max_keys']}件、記録{history['events']}件）",
+            inline=False
+        )
+
         allowed_roles = [f"<@&{role_id}>" for role_id in self.allowed_roles]
         embed.add_field(
             name="除外ロール",
@@ -267,6 +571,38 @@ class AntiSpam(commands.Cog):
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @app_commands.command(name="spamlog", description="スパム対処の記録を表示します")
+    @app_commands.describe(user="対象のユーザー（省略時はサーバー全体）", limit="表示する件数（最大20件）")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.guild_only()
+    async def spam_log(self, interaction: discord.Interaction, user: Optional[discord.User] = None,
+                       limit: app_commands.Range[int, 1, 20] = 10):
+        """スパム対処の記録を新しい順に表示します"""
+        await interaction.response.defer(ephemeral=True)
+        loop = asyncio.get_running_loop()
+        incidents = await loop.run_in_executor(
+            None, self.journal.query, interaction.guild_id, user.id if user else None, limit
+        )
+        if not incidents:
+            await interaction.followup.send("記録はありません。", ephemeral=True)
+            return
+
+        embed = discord.Embed(title="スパム対処の記録", color=discord.Color.orange(), timestamp=utcnow())
+        reason_names = {'rate': '連投', 'duplicate': '同一内容', 'attachment': '同一ファイル', 'mention': 'メンション'}
+        for incident in incidents:
+            timestamp = int(datetime.datetime.fromisoformat(incident['ts']).timestamp())
+            channels = ' '.join(f"<#{channel_id}>" for channel_id in incident.get('channel_ids', [])[:5])
+            embed.add_field(
+                name=incident['ts'][:19].replace('T', ' ') + " UTC",
+                value=(
+                    f"<@{incident['user_id']}> / {reason_names.get(incident.get('reason'), incident.get('reason'))}"
+                    f" / {incident.get('action')} / {incident.get('message_count', 0)}件\n"
+                    f"<t:{timestamp}:R> {channels}"
+                )[:1024],
+                inline=False
+            )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(AntiSpam(bot))
     try:
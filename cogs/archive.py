@@ -1,7 +1,6 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import sqlite3
 import json
 from typing import Union, List, Optional
 import asyncio
@@ -12,38 +11,28 @@ class Archive(commands.Cog):
         self.archive_channel = {}
         self.allowed_users = set()
         self.allowed_roles = set()
-        self.load_permissions()
-        self.load_archive_channels()
         self.bot_id = 1305765130579083345  # ボットのユーザーID
 
-    def load_permissions(self):
+    async def cog_load(self):
+        await self.load_permissions()
+        await self.load_archive_channels()
+
+    async def load_permissions(self):
         try:
-            with sqlite3.connect('bot_statistics.db') as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                CREATE TABLE IF NOT EXISTS archive_permissions
-                (guild_id TEXT, user_id TEXT, role_id TEXT)
-                ''')
-                cursor.execute('SELECT guild_id, user_id, role_id FROM archive_permissions')
-                for row in cursor.fetchall():
-                    if row[1]:
-                        self.allowed_users.add(int(row[1]))
-                    if row[2]:
-                        self.allowed_roles.add(int(row[2]))
+            rows = await self.bot.db.fetchall('SELECT guild_id, user_id, role_id FROM archive_permissions')
+            for row in rows:
+                if row[1]:
+                    self.allowed_users.add(row[1])
+                if row[2]:
+                    self.allowed_roles.add(row[2])
         except Exception as e:
             print(f"権限の読み込み中にエラーが発生しました: {e}")
 
-    def load_archive_channels(self):
+    async def load_archive_channels(self):
         try:
-            with sqlite3.connect('bot_statistics.db') as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                CREATE TABLE IF NOT EXISTS archive_channels
-                (guild_id TEXT, channel_id TEXT)
-                ''')
-                cursor.execute('SELECT guild_id, channel_id FROM archive_channels')
-                for row in cursor.fetchall():
-                    self.archive_channel[int(row[0])] = int(row[1])
+            rows = await self.bot.db.fetchall('SELECT guild_id, channel_id FROM archive_channels')
+            for row in rows:
+                self.archive_channel[row[0]] = row[1]
         except Exception as e:
             print(f"アーカイブチャンネルの読み込み中にエラーが発生しました: {e}")
 
@@ -121,17 +110,14 @@ class Archive(commands.Cog):
             return
 
         try:
-            with sqlite3.connect('bot_statistics.db') as conn:
-                cursor = conn.cursor()
-                if isinstance(target, discord.Role):
-                    self.allowed_roles.add(target.id)
-                    cursor.execute('INSERT INTO archive_permissions (guild_id, role_id) VALUES (?, ?)',
-                                 (str(interaction.guild_id), str(target.id)))
-                else:
-                    self.allowed_users.add(target.id)
-                    cursor.execute('INSERT INTO archive_permissions (guild_id, user_id) VALUES (?, ?)',
-                                 (str(interaction.guild_id), str(target.id)))
-                conn.commit()
+            if isinstance(target, discord.Role):
+                await self.bot.db.execute('INSERT INTO archive_permissions (guild_id, role_id) VALUES (?, ?)',
+                                          (interaction.guild_id, target.id))
+                self.allowed_roles.add(target.id)
+            else:
+                await self.bot.db.execute('INSERT INTO archive_permissions (guild_id, user_id) VALUES (?, ?)',
+                                          (interaction.guild_id, target.id))
+                self.allowed_users.add(target.id)
             
             await interaction.response.send_message(
                 f"{'ロール' if isinstance(target, discord.Role) else 'ユーザー'} {target.name} に権限を付与しました。"
@@ -0,0 +1,248 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from discord.utils import utcnow
+from typing import Dict, Optional, Set
+
+from utils.guild_settings import SlowmodePolicy
+from utils.sliding_window import SlidingWindowCounter
+
+# 自動で設定する低速モードの段階（秒）。max_delay を超える段階は使わない
+SLOWMODE_STEPS = (0, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 21600)
+# メッセージ数と発言者数の指数移動平均の時定数（秒）
+EWMA_WINDOW = 30.0
+# 推定値が閾値のこの割合を下回ったら1段階下げる（上げる閾値との間を空けて、上げ下げを繰り返さない）
+RELEASE_RATIO = 0.5
+# 低速モードを下げられるか確認する間隔（秒）
+DECAY_INTERVAL = 30
+# この秒数メッセージがなく、低速モードも設定していないチャンネルの推定値は破棄する
+IDLE_TTL = 600
+# 1チャンネルあたり、発言者数の推定のために覚えておく人数
+MAX_AUTHORS_PER_CHANNEL = 1000
+
+class ChannelRate:
+    """
+    1チャンネル分のメッセージ数と発言者数の推定値
+
+    どちらも時定数 EWMA_WINDOW の指数移動平均で、メッセージごとの更新は償却O(1)。
+    発言者数は直近 EWMA_WINDOW 秒に発言した人数（最後の発言順に並べた辞書の長さ）を平滑化したもの。
+    """
+
+    __slots__ = ('rate', 'author_count', 'updated_at', 'authors', 'step', 'applied', 'changed_at', 'pending')
+
+    def __init__(self, now: float):
+        self.rate = 0.0         # 1秒あたりのメッセージ数
+        self.author_count = 0.0  # 直近 EWMA_WINDOW 秒の発言者数
+        self.updated_at = now
+        self.authors: 'OrderedDict[int, float]' = OrderedDict()
+        self.step = 0                    # SLOWMODE_STEPS の段階
+        self.applied: Optional[int] = None  # Botが最後に設定した低速モード（秒）
+        self.changed_at = 0.0
+        self.pending = False
+
+    def decayed(self, now: float):
+        """now 時点の (1分あたりのメッセージ数, 発言者数) の推定値"""
+        decay = math.exp(-max(now - self.updated_at, 0.0) / EWMA_WINDOW)
+        return self.rate * decay * 60, self.author_count * decay
+
+    def observe(self, author_id: int, now: float) -> None:
+        decay = math.exp(-max(now - self.updated_at, 0.0) / EWMA_WINDOW)
+        self.updated_at = now
+        self.rate = self.rate * decay + 1 / EWMA_WINDOW
+
+        authors = self.authors
+        cutoff = now - EWMA_WINDOW
+        while authors:
+            oldest, seen_at = next(iter(authors.items()))
+            if seen_at > cutoff and len(authors) <= MAX_AUTHORS_PER_CHANNEL:
+                break
+            del authors[oldest]
+        authors[author_id] = now
+        authors.move_to_end(author_id)
+        self.author_count = self.author_count * decay + len(authors) * (1 - decay)
+
+class AutoSlowmode(commands.Cog):
+    """
+    メッセージの勢いに応じたチャンネルの低速モードの自動調整
+
+    多くの人が同時に発言してメッセージ数が rate_threshold を超えたら低速モードを1段階上げ、
+    落ち着いたら1段階ずつ戻す。個々のメッセージを削除・タイムアウトする代わりに、
+    チャンネルの編集1回で流量を抑える。モデレーターが手動で変更したチャンネルには触れない。
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.logger = logging.getLogger('bot.autoslowmode')
+        self.channels: Dict[int, ChannelRate] = {}
+        # チャンネルごとの直近1時間の変更回数
+        self.edit_history = SlidingWindowCounter(max_keys=10000, idle_ttl=3600)
+        self._task: Optional[asyncio.Task] = None
+        self._edits: Set[asyncio.Task] = set()
+
+    async def cog_load(self):
+        self._task = asyncio.create_task(self.decay_loop())
+
+    def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+        for task in self._edits:
+            task.cancel()
+
+    def get_policy(self, guild_id: int) -> SlowmodePolicy:
+        return self.bot.config_manager.get_settings(guild_id).slowmode
+
+    @staticmethod
+    def steps_for(policy: SlowmodePolicy):
+        return [delay for delay in SLOWMODE_STEPS if delay <= policy.max_delay]
+
+    def can_edit(self, state: ChannelRate, channel_id: int, policy: SlowmodePolicy, now: float) -> bool:
+        if state.pending or now - state.changed_at < policy.hold_time:
+            return False
+        return self.edit_history.count(channel_id, 3600) < policy.max_edits_per_hour
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.author.bot or not isinstance(message.channel, discord.TextChannel):
+            return
+        policy = self.get_policy(message.guild.id)
+        if not policy.enabled:
+            return
+
+        now = time.monotonic()
+        channel = message.channel
+        state = self.channels.get(channel.id)
+        if state is None:
+            state = self.channels[channel.id] = ChannelRate(now)
+        state.observe(message.author.id, now)
+
+        rate, authors = state.decayed(now)
+        if rate < policy.rate_threshold or authors < policy.author_threshold:
+            return
+        steps = self.steps_for(policy)
+        if state.step + 1 >= len(steps) or not self.can_edit(state, channel.id, policy, now):
+            return
+        # モデレーターが設定した低速モードの方が長ければ何もしない
+        if channel.slowmode_delay >= steps[state.step + 1]:
+            return
+        if state.applied is not None and channel.slowmode_delay != state.applied:
+            return
+        self.schedule_edit(channel, state, state.step + 1, steps, rate, authors)
+
+    def schedule_edit(self, channel: discord.TextChannel, state: ChannelRate, step: int, steps,
+                      rate: float, authors: float) -> None:
+        """低速モードの変更をバックグラウンドで行う（イベントループを止めない）"""
+        state.pending = True
+        task = asyncio.create_task(self.edit_slowmode(channel, state, step, steps[step], rate, authors))
+        self._edits.add(task)
+        task.add_done_callback(self._edits.discard)
+
+    async def edit_slowmode(self, channel: discord.TextChannel, state: ChannelRate, step: int, delay: int,
+                            rate: float, authors: float):
+        raising = step > state.step
+        try:
+            if not channel.permissions_for(channel.guild.me).manage_channels:
+                return
+            await channel.edit(slowmode_delay=delay, reason="Auto slowmode")
+            state.step = step
+            state.applied = delay if step else None
+            self.edit_history.hit(channel.id, 3600)
+            self.logger.info(
+                f"低速モードを{delay}秒に変更しました（チャンネル: {channel.id}、"
+                f"推定 {rate:.0f}件/分・{authors:.1f}人）"
+            )
+            if raising and state.step == 1:
+                await self.send_log(channel, delay, rate, authors)
+        except discord.HTTPException as e:
+            self.logger.warning(f"低速モードを変更できませんでした（チャンネル: {channel.id}）: {e}")
+        finally:
+            state.changed_at = time.monotonic()
+            state.pending = False
+
+    async def send_log(self, channel: discord.TextChannel, delay: int, rate: float, authors: float):
+        logging_cog = self.bot.get_cog('LoggingCog')
+        if logging_cog is None:
+            return
+        embed = discord.Embed(
+            title="自動低速モード",
+            description=f"{channel.mention} のメッセージが急増したため、低速モードを{delay}秒にしました。",
+            color=discord.Color.orange(),
+            timestamp=utcnow()
+        )
+        embed.add_field(name="メッセージ数（推定）", value=f"{rate:.0f}件/分", inline=True)
+        embed.add_field(name="発言者数（推定）", value=f"{authors:.0f}人", inline=True)
+        await logging_cog.send_log(channel.guild.id, embed)
+
+    async def decay_loop(self):
+        """落ち着いたチャンネルの低速モードを1段階ずつ戻し、不要になった推定値を破棄する"""
+        while True:
+            await asyncio.sleep(DECAY_INTERVAL)
+            try:
+                self.decay(time.monotonic())
+            except Exception as e:
+                self.logger.error(f"低速モードの確認中にエラーが発生しました: {e}")
+
+    def decay(self, now: float) -> None:
+        for channel_id, state in list(self.channels.items()):
+            if state.step == 0:
+                if not state.pending and now - state.updated_at > IDLE_TTL:
+                    del self.channels[channel_id]
+                continue
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                del self.channels[channel_id]
+                continue
+            if channel.slowmode_delay != state.applied:
+                # モデレーターが変更したので以後は管理しない
+                del self.channels[channel_id]
+                continue
+            policy = self.get_policy(channel.guild.id)
+            rate, authors = state.decayed(now)
+            if policy.enabled and rate >= policy.rate_threshold * RELEASE_RATIO:
+                continue
+            if not self.can_edit(state, channel_id, policy, now):
+                continue
+            steps = self.steps_for(policy)
+            step = min(state.step - 1, len(steps) - 1) if policy.enabled else 0
+            self.schedule_edit(channel, state, step, steps, rate, authors)
+
+    @app_commands.command(name="slowmodestatus", description="自動低速モードの設定と状態を表示")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.guild_only()
+    async def slowmode_status(self, interaction: discord.Interaction):
+        policy = self.get_policy(interaction.guild_id)
+        embed = discord.Embed(
+            title="自動低速モード",
+            color=discord.Color.blue(),
+            timestamp=utcnow()
+        )
+        embed.add_field(name="状態", value="有効" if policy.enabled else "無効", inline=False)
+        embed.add_field(
+            name="閾値",
+            value=f"1分あたり{policy.rate_threshold}件以上・{policy.author_threshold}人以上",
+            inline=False
+        )
+        embed.add_field(name="上限", value=f"{policy.max_delay}秒", inline=True)
+        embed.add_field(
+            name="変更の間隔",
+            value=f"{policy.hold_time}秒以上・1時間に{policy.max_edits_per_hour}回まで",
+            inline=True
+        )
+
+        now = time.monotonic()
+        active = []
+        for channel in interaction.guild.text_channels:
+            state = self.channels.get(channel.id)
+            if state is not None and state.step:
+                rate, authors = state.decayed(now)
+                active.append(f"{channel.mention}: {state.applied}秒（{rate:.0f}件/分・{authors:.1f}人）")
+        if active:
+            embed.add_field(name="調整中のチャンネル", value='\n'.join(active)[:1024], inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(AutoSlowmode(bot))
@@ -15,7 +15,6 @@ import asyncio
 import traceback
 from discord.ext.commands import Context
 from utils.checks import BaseCog
-from utils import ConfigManager
 
 class DebugManager(BaseCog, commands.GroupCog, name="debug"):
     """デバッグ関連のコマンドを管理するCog"""
@@ -23,7 +22,8 @@ class DebugManager(BaseCog, commands.GroupCog, name="debug"):
     def __init__(self, bot: commands.Bot):
         BaseCog.__init__(self, bot)  # BaseCogの初期化
         commands.GroupCog.__init__(self)  # GroupCogの初期化
-        self.config = ConfigManager()
+        # Bot全体で共有しているインスタンスを使う（別インスタンスだと変更が他のCogに見えない）
+        self.config = bot.config_manager
         self.config_manager = self.config
 
         self._last_result = None
@@ -531,6 +531,37 @@ class DebugManager(BaseCog, commands.GroupCog, name="debug"):
 
         await interaction.response.send_message(embed=embed)
         
+    @app_commands.command(name="db")
+    @owner_only()
+    @app_commands.describe(limit="表示する文の数（合計時間の長い順）")
+    async def display_db(self, interaction: discord.Interaction, limit: int = 8):
+        """DBの文ごとの実行時間を表示します"""
+        query_stats = self.bot.db.query_stats
+        top = query_stats.top(max(1, min(limit, 20)))
+
+        embed = discord.Embed(
+            title="Database Statements",
+            description=f"Slow queries (>= {query_stats.slow_threshold_ms:.0f} ms): {query_stats.slow_count}",
+            color=discord.Color.blue(),
+            timestamp=datetime.now()
+        )
+
+        if not top:
+            embed.add_field(name="No data", value="まだ実行された文はありません。", inline=False)
+
+        for sql, stats in top[:20]:
+            embed.add_field(
+                name=sql[:250],
+                value=f"```\n"
+                      f"Total: {stats.total_ms:.1f} ms / Count: {stats.count}\n"
+                      f"Avg: {stats.avg_ms:.2f} ms / p95: {stats.percentile_ms(95):.0f} ms / Max: {stats.max_ms:.1f} ms\n"
+                      f"Rows: {stats.rows}\n"
+                      f"```",
+                inline=False
+            )
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name="voice")   
     @owner_only()  
     @app_commands.describe(guild_id="サーバーID（省略時は現在のサーバー）")
@@ -11,6 +11,7 @@ from admin.member_logging import MemberLogging
 from admin.server_logging import ServerLogging
 from admin.voice_logging import VoiceLogging
 from admin.thread_logging import ThreadLogging
+from utils.config_manager import ConfigChange
 
 class LoggingCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -22,6 +23,7 @@ class LoggingCog(commands.Cog):
         self.archive_channel = None
         self._admin_delete_in_progress = False  # 管理者削除コマンドのフラグ
         self.load_config()
+        self.config_manager.subscribe(self.on_config_change)
         
         # 各種ログ機能のインスタンスを作成
         self.message_logging = MessageLogging(self)
@@ -49,6 +51,14 @@ class LoggingCog(commands.Cog):
         except Exception as e:
             self.logger.error(f"設定の読み込み中にエラーが発生しました: {e}")
 
+    def cog_unload(self):
+        self.config_manager.unsubscribe(self.on_config_change)
+
+    def on_config_change(self, change: ConfigChange):
+        """グローバル設定の変更時にログ・アーカイブチャンネルを読み直す"""
+        if change.guild_id is None:
+            self.load_config()
+
     def get_archive_channel(self) -> Optional[discord.TextChannel]:
         """アーカイブチャンネルを取得する"""
         try:
@@ -145,22 +155,14 @@ class LoggingCog(commands.Cog):
             ログチャンネル。設定がない場合はNone
         """
         try:
-            guild_config = self.config_manager.get_guild_config(str(guild_id))
-            if not guild_config:
-                return None
-            
-            channel_id = None
+            # ギルドの設定は変更時にだけ作り直される GuildSettings から参照する
+            settings = self.config_manager.get_settings(guild_id)
+            channel_id = settings.log_channel_id
             if log_type == 'vc':
-                # まずVCログチャンネルを試す
-                channel_id = guild_config.get('vc_log_channel')
-                # VCログチャンネルが未設定の場合、一般ログチャンネルを試す
-                if not channel_id:
-                    channel_id = guild_config.get('log_channel')
-            else:
-                channel_id = guild_config.get('log_channel')
-            
+                # VCログチャンネルが未設定の場合、一般ログチャンネルにフォールバック
+                channel_id = settings.vc_log_channel_id or channel_id
             if channel_id:
-                return self.bot.get_channel(int(channel_id))
+                return self.bot.get_channel(channel_id)
         except Exception as e:
             self.logger.error(f"ログチャンネルの取得中にエラーが発生しました: {e}")
         return None
@@ -244,6 +246,11 @@ class LoggingCog(commands.Cog):
     async def on_invite_create(self, invite):
         await self.server_logging.on_invite_create(invite)
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # 起動・再接続時にVC滞在セッションを復元
+        self.voice_logging.recover_sessions()
+
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
         await self.voice_logging.on_voice_state_update(member, before, after)
@@ -8,12 +8,16 @@ import os
 from typing import Optional
 from utils.checks import BaseCog, NoPrivateMessageCheck
 from discord import app_commands
+from database import day_number
+# 時間単位の集計を残す日数
+HOURLY_RETENTION_DAYS = 14
 
 class StatsManager(BaseCog):
     def __init__(self, bot: commands.Bot):
         super().__init__(bot)  # BaseCogの__init__を正しく呼び出す
         self._is_running = True
         self.update_stats.start()
+        self.maintain_database.start()
 
     def owner_only():
         async def predicate(interaction: discord.Interaction) -> bool:
@@ -30,6 +34,7 @@ class StatsManager(BaseCog):
     def cog_unload(self):
         self._is_running = False
         self.update_stats.cancel()
+        self.maintain_database.cancel()
 
     async def get_cpu_percent(self) -> float:
         """CPU使用率を非同期的に取得"""
@@ -83,5 +88,43 @@ class StatsManager(BaseCog):
         else:
             self.logger.error(f"Unexpected error in stats update: {error}")
 
+    def get_retention_days(self, guild_id: int) -> int:
+        """ギルドのユーザー単位統計の保持日数を取得"""
+        return self.bot.config_manager.get_settings(guild_id).stats_retention_days
+
+    @tasks.loop(hours=6)
+    async def maintain_database(self):
+        """
+        古い統計を整理してDBを小さく保つ
+
+        ユーザー単位の行は保持日数を過ぎたら削除する（ギルド単位の値は
+        日・週の集計テーブルに残る）。削除は小分けに行い、最後に空きページを解放する。
+        """
+        try:
+            db = self.bot.db
+            today = day_number(datetime.date.today())
+            cutoff_hour = (today - HOURLY_RETENTION_DAYS) * 24
+            deleted = 0
+
+            for guild_id in await db.get_stats_guild_ids():
+                cutoff_day = today - self.get_retention_days(guild_id)
+                deleted += await db.prune_user_stats(guild_id, cutoff_day)
+                deleted += await db.prune_hourly_activity(guild_id, cutoff_hour)
+
+            # 十分に減衰したユーザーの評判
+            deleted += await self.bot.reputation.prune()
+
+            freed = await db.incremental_vacuum()
+            self.logger.info(f"Database maintenance finished - deleted rows: {deleted}, free pages: {freed}")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Error in database maintenance: {e}")
+
+    @maintain_database.before_loop
+    async def before_maintain_database(self):
+        await self.bot.wait_until_ready()
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(StatsManager(bot))
\ No newline at end of file
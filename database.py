@@ -1,45 +1,409 @@
-import sqlite3
-import datetime
 import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Any, Callable, Iterable, List, Optional, Sequence, TypeVar
+
+import aiosqlite
+
+from migrations import run_migrations
+from utils.query_stats import QueryStats
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def day_number(d: date) -> int:
+    """日付を統計テーブルの day 列（1970-01-01からの日数）に変換する"""
+    return d.toordinal() - _EPOCH_ORDINAL
+
+def day_to_date(day: int) -> date:
+    """day 列の値を日付に戻す"""
+    return date.fromordinal(day + _EPOCH_ORDINAL)
+
+def week_number(day: int) -> int:
+    """day 列の値を月曜始まりの週番号に変換する（1970-01-01は木曜日）"""
+    return (day + 3) // 7
+
+T = TypeVar('T')
+
+class ReadPool:
+    """
+    分析用クエリのための読み取り専用接続プール
+
+    スレッドプールの各ワーカーが自分専用の読み取り専用接続を持つ。
+    WALモードでは読み取りと書き込みが並行できるため、重い集計クエリが
+    書き込み（統計のフラッシュ）を待たせず、書き込み中もコマンドは待たされない。
+    """
+
+    def __init__(self, path: str, size: int = 3, busy_timeout: int = 5000,
+                 cached_statements: int = 256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='db-read')
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ワーカースレッド専用の接続を返す（初回のみ開く）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                f'file:{self.path}?mode=ro', uri=True,
+                check_same_thread=False, cached_statements=self.cached_statements
+            )
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    async def run(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        """接続を受け取る関数をワーカースレッドで実行する"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(self._connection()))
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('bot_statistics.db')
-        self.cursor = self.conn.cursor()
-        self.init_database()
-    
-    def init_database(self):
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS message_stats (
-                guild_id INTEGER,
-                user_id INTEGER,
-                date TEXT,
-                message_count INTEGER,
-                PRIMARY KEY (guild_id, user_id, date)
+    """
+    bot_statistics.db への非同期アクセスをまとめたストレージ層
+
+    接続はaiosqliteの専用スレッドで動くため、ディスクが遅くても
+    イベントループ（ゲートウェイのハートビートなど）は止まらない。
+    書き込みは1つの接続に集約し、asyncio.Lockでトランザクション単位に直列化する。
+    読み取り（fetchone / fetchall）は接続後、ReadPoolの読み取り専用接続で実行する。
+    実行した文はすべて query_stats にレイテンシと影響行数が記録される。
+    """
+
+    def __init__(self, path: str = 'bot_statistics.db', busy_timeout: int = 5000,
+                 cached_statements: int = 256, read_pool_size: int = 3):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.read_pool_size = read_pool_size
+        self.conn: Optional[aiosqlite.Connection] = None
+        self.reader: Optional[ReadPool] = None
+        self.logger = logging.getLogger('bot.database')
+        self.query_stats = QueryStats()
+        self._write_lock = asyncio.Lock()
+
+    async def connect(self):
+        """接続を開き、PRAGMAの設定とスキーマの初期化を行う"""
+        if self.conn is not None:
+            return
+        # cached_statements はsqlite3.connectへ渡され、プリペアドステートメントを再利用する
+        self.conn = await aiosqlite.connect(self.path, cached_statements=self.cached_statements)
+        await self.conn.execute('PRAGMA journal_mode=WAL')
+        await self.conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        await self.conn.execute('PRAGMA synchronous=NORMAL')
+        await self._enable_incremental_vacuum()
+        await self.init_database()
+        # スキーマが揃ってから読み取り専用プールを用意する
+        self.reader = ReadPool(self.path, self.read_pool_size, self.busy_timeout, self.cached_statements)
+
+    async def _enable_incremental_vacuum(self):
+        """
+        auto_vacuum=INCREMENTAL を有効にする
+
+        既存のDBでは設定の反映にVACUUMが必要なため、初回のみ実行する
+        （トランザクション外で実行する必要がある）
+        """
+        row = await self.fetchone('PRAGMA auto_vacuum')
+        if row and row[0] == 2:
+            return
+        self.logger.info("Enabling incremental auto_vacuum (one-time VACUUM)")
+        await self.conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        await self.conn.execute('VACUUM')
+
+    async def init_database(self):
+        """未適用のスキーママイグレーションを実行する"""
+        version = await run_migrations(self)
+        self.logger.info(f"Database schema version: {version}")
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        書き込み用のトランザクション
+
+        ブロック内の処理は他の書き込みと混ざらず、正常終了でcommit、例外でrollbackする。
+        """
+        async with self._write_lock:
+            acquired = time.perf_counter()
+            # DDLも含めてブロック全体を1トランザクションにするため明示的に開始する
+            await self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            else:
+                commit_start = time.perf_counter()
+                await self.conn.commit()
+                self.query_stats.record('COMMIT', (time.perf_counter() - commit_start) * 1000)
+            finally:
+                # 書き込みロックを保持していた時間（BEGINからCOMMIT/ROLLBACKまで）
+                self.query_stats.record('<write transaction>', (time.perf_counter() - acquired) * 1000)
+
+    async def _run(self, conn: aiosqlite.Connection, sql: str, params: Any = (),
+                   many: bool = False) -> aiosqlite.Cursor:
+        """書き込み接続で文を実行し、所要時間と影響行数を記録する"""
+        start = time.perf_counter()
+        if many:
+            params = list(params)
+            cursor = await conn.executemany(sql, params)
+        else:
+            cursor = await conn.execute(sql, params)
+        self.query_stats.record(sql, (time.perf_counter() - start) * 1000, cursor.rowcount, params)
+        return cursor
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """書き込みを1文実行してcommitし、影響を受けた行数を返す"""
+        async with self.transaction() as conn:
+            cursor = await self._run(conn, sql, params)
+            return cursor.rowcount
+
+    async def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> int:
+        """同じ文を複数のパラメータでまとめて実行してcommitする"""
+        async with self.transaction() as conn:
+            cursor = await self._run(conn, sql, seq_of_params, many=True)
+            return cursor.rowcount
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        start = time.perf_counter()
+        if self.reader is not None:
+            row = await self.reader.fetchone(sql, params)
+        else:
+            async with self.conn.execute(sql, params) as cursor:
+                row = await cursor.fetchone()
+        self.query_stats.record(sql, (time.perf_counter() - start) * 1000, int(row is not None), params)
+        return row
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        start = time.perf_counter()
+        if self.reader is not None:
+            rows = await self.reader.fetchall(sql, params)
+        else:
+            async with self.conn.execute(sql, params) as cursor:
+                rows = list(await cursor.fetchall())
+        self.query_stats.record(sql, (time.perf_counter() - start) * 1000, len(rows), params)
+        return rows
+
+    async def add_stats(self, message_rows, voice_rows=(), hourly_rows=()):
+        """
+        メッセージ数とVC滞在時間の差分をまとめて加算する
+
+        message_rows : (guild_id, user_id, day, count)
+        voice_rows   : (guild_id, user_id, day, seconds)
+        hourly_rows  : (guild_id, hour, count)
+
+        ユーザー単位のテーブルに加え、ギルド単位の日・週の集計テーブルも
+        同じトランザクションで更新する。イベントごとにcommitする場合と比べて
+        書き込み回数が大幅に減る
+        """
+        daily = defaultdict(lambda: [0, 0])
+        weekly = defaultdict(lambda: [0, 0])
+        for guild_id, _, day, count in message_rows:
+            daily[(guild_id, day)][0] += count
+            weekly[(guild_id, week_number(day))][0] += count
+        for guild_id, _, day, seconds in voice_rows:
+            daily[(guild_id, day)][1] += seconds
+            weekly[(guild_id, week_number(day))][1] += seconds
+
+        async with self.transaction() as conn:
+            if message_rows:
+                await self._run(conn, '''
+                    INSERT INTO message_stats (guild_id, user_id, day, message_count)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(guild_id, user_id, day)
+                    DO UPDATE SET message_count = message_count + excluded.message_count
+                ''', message_rows, many=True)
+            if voice_rows:
+                await self._run(conn, '''
+                    INSERT INTO voice_stats (guild_id, user_id, day, voice_time)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(guild_id, user_id, day)
+                    DO UPDATE SET voice_time = voice_time + excluded.voice_time
+                ''', voice_rows, many=True)
+            if hourly_rows:
+                await self._run(conn, '''
+                    INSERT INTO guild_activity_hourly (guild_id, hour, message_count)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(guild_id, hour)
+                    DO UPDATE SET message_count = message_count + excluded.message_count
+                ''', hourly_rows, many=True)
+            for table, bucket, totals in (('guild_activity_daily', 'day', daily),
+                                          ('guild_activity_weekly', 'week', weekly)):
+                if not totals:
+                    continue
+                await self._run(conn, f'''
+                    INSERT INTO {table} (guild_id, {bucket}, message_count, voice_time)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(guild_id, {bucket})
+                    DO UPDATE SET message_count = message_count + excluded.message_count,
+                                  voice_time = voice_time + excluded.voice_time
+                ''', [(guild_id, key, counts[0], counts[1]) for (guild_id, key), counts in totals.items()], many=True)
+
+    async def get_activity_totals(self, guild_id: int, first_day: int, last_day: int):
+        """
+        期間内の (メッセージ数, VC秒数) を集計テーブルから返す
+
+        期間に丸ごと含まれる週は guild_activity_weekly の1行で、前後のはみ出した日だけ
+        guild_activity_daily から読む。長い期間でも読み込む行数は「週数 + 最大12日」で済む
+        """
+        # 週 w は day が 7w-3 〜 7w+3 の7日間
+        first_week = week_number(first_day + 6)
+        last_week = week_number(last_day + 1) - 1
+        if first_week > last_week:
+            row = await self.fetchone('''
+                SELECT COALESCE(SUM(message_count), 0), COALESCE(SUM(voice_time), 0)
+                FROM guild_activity_daily
+                WHERE guild_id = ? AND day BETWEEN ? AND ?
+            ''', (guild_id, first_day, last_day))
+            return row[0], row[1]
+
+        row = await self.fetchone('''
+            SELECT COALESCE(SUM(message_count), 0), COALESCE(SUM(voice_time), 0)
+            FROM (
+                SELECT message_count, voice_time FROM guild_activity_weekly
+                WHERE guild_id = ? AND week BETWEEN ? AND ?
+                UNION ALL
+                SELECT message_count, voice_time FROM guild_activity_daily
+                WHERE guild_id = ? AND (day BETWEEN ? AND ? OR day BETWEEN ? AND ?)
             )
-        ''')
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS voice_stats (
-                guild_id INTEGER,
-                user_id INTEGER,
-                date TEXT,
-                voice_time INTEGER,
-                PRIMARY KEY (guild_id, user_id, date)
+        ''', (guild_id, first_week, last_week,
+              guild_id, first_day, first_week * 7 - 4, last_week * 7 + 4, last_day))
+        return row[0], row[1]
+
+    async def get_hourly_activity(self, guild_id: int, first_hour: int, last_hour: int) -> List[tuple]:
+        """guild_activity_hourly から期間内の (hour, メッセージ数) を時間順に返す（0件の時間は含まない）"""
+        return await self.fetchall('''
+            SELECT hour, message_count
+            FROM guild_activity_hourly
+            WHERE guild_id = ? AND hour BETWEEN ? AND ?
+            ORDER BY hour
+        ''', (guild_id, first_hour, last_hour))
+
+    async def get_stats_guild_ids(self) -> List[int]:
+        """統計が記録されているギルドIDの一覧"""
+        rows = await self.fetchall('SELECT DISTINCT guild_id FROM guild_activity_daily')
+        return [row[0] for row in rows]
+
+    async def delete_in_chunks(self, table: str, where: str, params: Sequence[Any],
+                               chunk_size: int = 500, pause: float = 0.05) -> int:
+        """
+        条件に合う行を chunk_size 件ずつ別トランザクションで削除する
+
+        1回の削除で書き込みロックを長く握らないようにし、チャンクの間で
+        統計のフラッシュなど他の書き込みが割り込めるようにする
+
+        Returns
+        -------
+        int
+            削除した行数
+        """
+        total = 0
+        while True:
+            deleted = await self.execute(f'''
+                DELETE FROM {table}
+                WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)
+            ''', (*params, chunk_size))
+            total += deleted
+            if deleted < chunk_size:
+                return total
+            await asyncio.sleep(pause)
+
+    async def prune_user_stats(self, guild_id: int, cutoff_day: int, chunk_size: int = 500) -> int:
+        """
+        cutoff_day より前のユーザー単位の行を削除する
+
+        ギルド単位の値は書き込み時に guild_activity_daily / weekly へ
+        集計済みのため、ユーザー単位の行を消しても期間集計は失われない
+        """
+        total = 0
+        for table in ('message_stats', 'voice_stats'):
+            total += await self.delete_in_chunks(
+                table, 'guild_id = ? AND day < ?', (guild_id, cutoff_day), chunk_size
             )
-        ''')
-        
-        self.conn.commit()
-    
-    def save_message_stats(self, guild_id, user_id, message_count):
-        today = datetime.datetime.now().strftime('%Y-%m-%d')
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO message_stats (guild_id, user_id, date, message_count)
-            VALUES (?, ?, ?, ?)
-        ''', (guild_id, user_id, today, message_count))
-        self.conn.commit()
-    
+        return total
+
+    async def prune_hourly_activity(self, guild_id: int, cutoff_hour: int, chunk_size: int = 500) -> int:
+        """cutoff_hour より前の時間単位の集計を削除する（日・週の集計は残る）"""
+        return await self.delete_in_chunks(
+            'guild_activity_hourly', 'guild_id = ? AND hour < ?', (guild_id, cutoff_hour), chunk_size
+        )
+
+    async def load_reputations(self, since: int, limit: int) -> List[tuple]:
+        """since（UNIX時刻）以降に更新された評判を新しい順に最大 limit 件返す"""
+        return await self.fetchall('''
+            SELECT user_id, score, incidents, last_guild_id, updated_at
+            FROM user_reputation
+            WHERE updated_at >= ?
+            ORDER BY updated_at DESC
+            LIMIT ?
+        ''', (since, limit))
+
+    async def get_reputation(self, user_id: int) -> Optional[tuple]:
+        return await self.fetchone('''
+            SELECT user_id, score, incidents, last_guild_id, updated_at
+            FROM user_reputation WHERE user_id = ?
+        ''', (user_id,))
+
+    async def save_reputations(self, rows) -> None:
+        """rows : (user_id, score, incidents, last_guild_id, updated_at)"""
+        async with self.transaction() as conn:
+            await self._run(conn, '''
+                INSERT INTO user_reputation (user_id, score, incidents, last_guild_id, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    score = excluded.score,
+                    incidents = excluded.incidents,
+                    last_guild_id = excluded.last_guild_id,
+                    updated_at = excluded.updated_at
+            ''', rows, many=True)
+
+    async def prune_reputations(self, cutoff: int, chunk_size: int = 500) -> int:
+        """cutoff（UNIX時刻）より前から更新のない評判を削除する"""
+        return await self.delete_in_chunks('user_reputation', 'updated_at < ?', (cutoff,), chunk_size)
+
+    async def incremental_vacuum(self, pages: int = 1000) -> int:
+        """
+        空きページを最大 pages 件だけファイルから切り詰める
+
+        Returns
+        -------
+        int
+            実行前の空きページ数
+        """
+        row = await self.fetchone('PRAGMA freelist_count')
+        freelist = row[0] if row else 0
+        if freelist:
+            async with self._write_lock:
+                # sqlite3のexecuteは結果列のない文を1ステップしか進めず1ページしか解放されないため、
+                # 最後まで実行されるexecutescriptを使う
+                await self.conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        return freelist
+
     async def close(self):
-        # async メソッドにする
-        if hasattr(self, 'conn') and self.conn is not None:
-            self.conn.close()
\ No newline at end of file
+        if self.reader is not None:
+            reader, self.reader = self.reader, None
+            await asyncio.get_running_loop().run_in_executor(None, reader.close)
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
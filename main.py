@@ -1,4 +1,5 @@
 import discord
+import aiohttp
 import asyncio
 import logging  
 import traceback
@@ -12,6 +13,11 @@ from dotenv import load_dotenv
 from database import Database
 from utils.checks import BaseCog
 from utils.config_manager import ConfigManager
+from utils.config_watcher import ConfigWatcher
+from utils.guild_settings import DEFAULT_SPAM_SETTINGS
+from utils.incident_journal import IncidentJournal
+from utils.reputation import ReputationStore
+from utils.stats_buffer import StatsBuffer
 
 load_dotenv()
 
@@ -28,15 +34,10 @@ class AdminBot(commands.Bot):
             intents=discord.Intents.all(),
             help_command=None
         )
-        self.config = {
-            'spam_settings': {
-                'message_count': 5,
-                'time_window': 5,
-                'action': 'timeout',
-                'timeout_duration': 300
-            }
-        }
+        self.config = {'spam_settings': dict(DEFAULT_SPAM_SETTINGS)}
         self.config_manager = ConfigManager()
+        # config.json の手動編集を再起動せずに反映する
+        self.config_watcher = ConfigWatcher(self.config_manager)
 
         # ロギング設定（既存のまま）
         os.makedirs('logs', exist_ok=True)
@@ -71,7 +72,11 @@ class AdminBot(commands.Bot):
 
         try:
             self.db = Database()
-            self.config_manager = ConfigManager()
+            self.stats_buffer = StatsBuffer(self.db)
+            # サーバーをまたいだスパム対処の履歴
+            self.reputation = ReputationStore(self.db)
+            # スパム対処の記録（logs/spam/incidents.ndjson）
+            self.incident_journal = IncidentJournal('logs/spam')
         except Exception as e:
             self.logger.error(f"Failed to initialize core components: {e}")
             raise
@@ -80,6 +85,19 @@ class AdminBot(commands.Bot):
         global_config = self.config_manager.get_global_config()
         self.config.update(global_config)
 
+        # DB接続（各Cogのcog_loadより前に開く）
+        await self.db.connect()
+
+        # メッセージ統計の定期書き込みを開始
+        self.stats_buffer.start()
+
+        await self.reputation.start()
+
+        # 添付ファイルの取得などに使う共有のHTTPセッション
+        self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+
+        await self.config_watcher.start()
+
         initial_extensions = [
             'error_handler',
             'cogs.admin',
@@ -88,6 +106,8 @@ class AdminBot(commands.Bot):
             'cogs.keepmessage',
             'cogs.archive',
             'cogs.anti_spam',
+            'cogs.anti_raid',
+            'cogs.auto_slowmode',
             'cogs.mod',
             'cogs.debug'
         ]
@@ -111,6 +131,35 @@ class AdminBot(commands.Bot):
         """Botのシャットダウン時の処理"""
         try:
             self.logger.info("Bot is shutting down gracefully...")
+            # ロックダウン中のサーバーの設定は、HTTPセッションやDBを閉じる前に元に戻す
+            anti_raid = self.get_cog('AntiRaid')
+            if anti_raid is not None:
+                try:
+                    await anti_raid.end_all_lockdowns()
+                except Exception as e:
+                    self.logger.error(f"Error ending raid lockdowns: {e}")
+            if hasattr(self, 'stats_buffer') and self.stats_buffer is not None:
+                try:
+                    await self.stats_buffer.close()
+                except Exception as e:
+                    self.logger.error(f"Error flushing stats buffer: {e}")
+            if hasattr(self, 'reputation') and self.reputation is not None:
+                try:
+                    await self.reputation.close()
+                except Exception as e:
+                    self.logger.error(f"Error saving reputations: {e}")
+            if getattr(self, 'incident_journal', None) is not None:
+                # キューに残っている記録を書き込み終えるまで待つ（スレッドの join はイベントループの外で行う）
+                await asyncio.get_running_loop().run_in_executor(None, self.incident_journal.close)
+            if hasattr(self, 'config_watcher') and self.config_watcher is not None:
+                await self.config_watcher.close()
+            if getattr(self, 'http_session', None) is not None:
+                await self.http_session.close()
+            if hasattr(self, 'config_manager') and self.config_manager is not None:
+                try:
+                    await self.config_manager.close()
+                except Exception as e:
+                    self.logger.error(f"Error saving config: {e}")
             if hasattr(self, 'db') and self.db is not None:
                 try:
                     await self.db.close()
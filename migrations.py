@@ -0,0 +1,213 @@
+"""
+bot_statistics.db のスキーママイグレーション
+
+schema_version テーブルに適用済みのバージョンを記録し、未適用のものだけを
+番号順に1つずつトランザクション内で実行する。
+新しい変更は MIGRATIONS の末尾に追加すること（既存のものは書き換えない）。
+"""
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, List, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger('bot.migrations')
+
+Migration = Tuple[int, str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+async def _initial_schema(conn: aiosqlite.Connection):
+    """バージョン管理導入前のスキーマ（既存DBでは何も変わらない）"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS message_stats (
+            guild_id INTEGER,
+            user_id INTEGER,
+            date TEXT,
+            message_count INTEGER,
+            PRIMARY KEY (guild_id, user_id, date)
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS voice_stats (
+            guild_id INTEGER,
+            user_id INTEGER,
+            date TEXT,
+            voice_time INTEGER,
+            PRIMARY KEY (guild_id, user_id, date)
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_permissions
+        (guild_id TEXT, user_id TEXT, role_id TEXT)
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_channels
+        (guild_id TEXT, channel_id TEXT)
+    ''')
+
+async def _typed_columns_and_indexes(conn: aiosqlite.Connection):
+    """
+    date TEXT を1970-01-01からの日数 (day INTEGER) に変換し、
+    ギルド単位の期間集計用にカバリングインデックスを追加する。
+    archive_* テーブルのIDもINTEGER型に揃える。
+    """
+    # julianday('YYYY-MM-DD') - 2440587.5 が1970-01-01からの日数になる
+    for table, value_column in (('message_stats', 'message_count'), ('voice_stats', 'voice_time')):
+        await conn.execute(f'''
+            CREATE TABLE {table}_new (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                {value_column} INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id, day)
+            )
+        ''')
+        await conn.execute(f'''
+            INSERT INTO {table}_new (guild_id, user_id, day, {value_column})
+            SELECT guild_id, user_id, CAST(julianday(date) - 2440587.5 AS INTEGER), SUM({value_column})
+            FROM {table}
+            WHERE guild_id IS NOT NULL AND user_id IS NOT NULL AND julianday(date) IS NOT NULL
+            GROUP BY 1, 2, 3
+        ''')
+        await conn.execute(f'DROP TABLE {table}')
+        await conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+        # SUM(...) WHERE guild_id = ? AND day BETWEEN ? AND ? をインデックスだけで返せるようにする
+        await conn.execute(f'''
+            CREATE INDEX idx_{table}_guild_day
+            ON {table} (guild_id, day, {value_column})
+        ''')
+
+    await conn.execute('''
+        CREATE TABLE archive_permissions_new (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER,
+            role_id INTEGER
+        )
+    ''')
+    await conn.execute('''
+        INSERT INTO archive_permissions_new (guild_id, user_id, role_id)
+        SELECT CAST(guild_id AS INTEGER), CAST(user_id AS INTEGER), CAST(role_id AS INTEGER)
+        FROM archive_permissions
+        WHERE guild_id IS NOT NULL
+    ''')
+    await conn.execute('DROP TABLE archive_permissions')
+    await conn.execute('ALTER TABLE archive_permissions_new RENAME TO archive_permissions')
+
+    await conn.execute('''
+        CREATE TABLE archive_channels_new (
+            guild_id INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL
+        )
+    ''')
+    # 重複がある場合は読み込み時と同じく後から登録されたものを優先する
+    await conn.execute('''
+        INSERT OR REPLACE INTO archive_channels_new (guild_id, channel_id)
+        SELECT CAST(guild_id AS INTEGER), CAST(channel_id AS INTEGER)
+        FROM archive_channels
+        WHERE guild_id IS NOT NULL AND channel_id IS NOT NULL
+        ORDER BY rowid
+    ''')
+    await conn.execute('DROP TABLE archive_channels')
+    await conn.execute('ALTER TABLE archive_channels_new RENAME TO archive_channels')
+
+async def _activity_rollups(conn: aiosqlite.Connection):
+    """
+    ギルド単位の時間・日・週ごとの集計テーブル
+
+    hour は1970-01-01 00:00（ローカル時刻）からの時間数、
+    week は月曜始まりの週番号 ((day + 3) // 7)。
+    日・週は既存の message_stats / voice_stats から埋める（時間単位は履歴がないため空）。
+    """
+    await conn.execute('''
+        CREATE TABLE guild_activity_hourly (
+            guild_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour)
+        )
+    ''')
+    for table, bucket in (('guild_activity_daily', 'day'), ('guild_activity_weekly', 'week')):
+        await conn.execute(f'''
+            CREATE TABLE {table} (
+                guild_id INTEGER NOT NULL,
+                {bucket} INTEGER NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                voice_time INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, {bucket})
+            )
+        ''')
+
+    for table, bucket_expr in (('guild_activity_daily', 'day'), ('guild_activity_weekly', '(day + 3) / 7')):
+        await conn.execute(f'''
+            INSERT INTO {table}
+            SELECT guild_id, bucket, SUM(message_count), SUM(voice_time)
+            FROM (
+                SELECT guild_id, {bucket_expr} AS bucket, message_count, 0 AS voice_time FROM message_stats
+                UNION ALL
+                SELECT guild_id, {bucket_expr} AS bucket, 0, voice_time FROM voice_stats
+            )
+            GROUP BY guild_id, bucket
+        ''')
+
+async def _user_reputation(conn: aiosqlite.Connection):
+    """
+    サーバーをまたいだユーザーの評判（スパム対処の履歴）
+
+    score は updated_at（UNIX時刻）時点の値で、読み込み時に経過時間に応じて減衰させる。
+    """
+    await conn.execute('''
+        CREATE TABLE user_reputation (
+            user_id INTEGER PRIMARY KEY,
+            score REAL NOT NULL,
+            incidents INTEGER NOT NULL DEFAULT 0,
+            last_guild_id INTEGER,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    await conn.execute('CREATE INDEX idx_user_reputation_updated ON user_reputation (updated_at)')
+
+MIGRATIONS: List[Migration] = [
+    (1, 'initial schema', _initial_schema),
+    (2, 'integer day numbers, typed archive tables and range indexes', _typed_columns_and_indexes),
+    (3, 'hourly, daily and weekly guild activity rollups', _activity_rollups),
+    (4, 'cross-guild user reputation', _user_reputation),
+]
+
+async def run_migrations(db) -> int:
+    """
+    未適用のマイグレーションを実行する
+
+    Parameters
+    ----------
+    db : Database
+        接続済みのDatabase
+
+    Returns
+    -------
+    int
+        適用後のスキーマバージョン
+    """
+    async with db.transaction() as conn:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+
+    row = await db.fetchone('SELECT MAX(version) FROM schema_version')
+    current = row[0] or 0
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        async with db.transaction() as conn:
+            await migrate(conn)
+            await conn.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, datetime.now().isoformat(timespec='seconds'))
+            )
+        current = version
+
+    return current
@@ -0,0 +1,40 @@
+import asyncio
+
+from database import Database
+
+def _run(tmp_path, scenario):
+    async def main():
+        db = Database(str(tmp_path / 'stats.db'))
+        await db.connect()
+        try:
+            await scenario(db)
+        finally:
+            await db.close()
+
+    asyncio.run(main())
+
+def test_totals_combine_weekly_and_daily_rollups(tmp_path):
+    # 1日ごとに件数の違うメッセージとVC時間を60日分
+    days = range(20000, 20060)
+    message_rows = [(1, 10, day, day - 19990) for day in days]
+    voice_rows = [(1, 10, day, (day - 19990) * 60) for day in days]
+
+    async def scenario(db):
+        await db.add_stats(message_rows, voice_rows)
+        # 別のギルドは集計に混ざらない
+        await db.add_stats([(2, 10, 20010, 1000)])
+        ranges = ((20000, 20059), (20003, 20045), (20010, 20012), (20005, 20011), (20020, 20020))
+        for first_day, last_day in ranges:
+            expected = sum(day - 19990 for day in range(first_day, last_day + 1))
+            assert await db.get_activity_totals(1, first_day, last_day) == (expected, expected * 60)
+
+    _run(tmp_path, scenario)
+
+def test_hourly_activity(tmp_path):
+    async def scenario(db):
+        await db.add_stats([(1, 10, 20000, 3)], hourly_rows=[(1, 480000, 1), (1, 480005, 2)])
+        await db.add_stats([], hourly_rows=[(1, 480005, 4), (2, 480005, 9)])
+        assert await db.get_hourly_activity(1, 480000, 480023) == [(480000, 1), (480005, 6)]
+        assert await db.get_hourly_activity(1, 480001, 480004) == []
+
+    _run(tmp_path, scenario)
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+
+from utils.config_manager import ConfigManager
+from utils.config_watcher import ConfigWatcher
+
+def _write(path, config):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    # 同じ秒・同じサイズの書き込みでも変更として検出させる
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def _run(tmp_path, scenario):
+    config_file = str(tmp_path / 'config.json')
+    store_path = str(tmp_path / 'config.db')
+
+    async def main():
+        manager = ConfigManager(config_file, store_path)
+        watcher = ConfigWatcher(manager)
+        await watcher.start()
+        try:
+            await scenario(manager, watcher, config_file)
+        finally:
+            await watcher.close()
+            await manager.close()
+
+    asyncio.run(main())
+
+def test_file_edit_keeps_command_changes(tmp_path):
+    _write(tmp_path / 'config.json', {'guilds': {'1': {
+        'banned_words': ['fileword'],
+        'spam_settings': {'message_count': 5, 'action': 'timeout'},
+    }}})
+
+    async def scenario(manager, watcher, config_file):
+        # コマンドによる変更
+        guild_config = manager.get_guild_config('1')
+        guild_config['banned_words'].append('cmdword')
+        guild_config['spam_settings']['message_count'] = 7
+        manager.update_guild_config('1', guild_config)
+
+        # その後のファイルの編集
+        _write(config_file, {'guilds': {'1': {
+            'banned_words': ['fileword', 'newword'],
+            'spam_settings': {'message_count': 5, 'action': 'ban'},
+        }}})
+        assert await watcher.check() == 1
+
+        settings = manager.get_settings(1)
+        assert settings.banned_words == frozenset({'fileword', 'cmdword', 'newword'})
+        assert settings.spam.message_count == 7
+        assert settings.spam.action == 'ban'
+
+    _run(tmp_path, scenario)
+
+def test_conflicting_scalar_keeps_command_value(tmp_path):
+    _write(tmp_path / 'config.json', {'guilds': {'1': {'spam_settings': {'message_count': 5}}}})
+
+    async def scenario(manager, watcher, config_file):
+        manager.update_guild_config('1', {'spam_settings': {'message_count': 7}})
+        _write(config_file, {'guilds': {'1': {'spam_settings': {'message_count': 9}}}})
+        await watcher.check()
+        assert manager.get_settings(1).spam.message_count == 7
+
+    _run(tmp_path, scenario)
+
+def test_removed_word_in_file_is_removed(tmp_path):
+    _write(tmp_path / 'config.json', {'guilds': {'1': {'banned_words': ['a', 'b']}}})
+
+    async def scenario(manager, watcher, config_file):
+        manager.update_guild_config('1', {'banned_words': ['a', 'b', 'c']})
+        _write(config_file, {'guilds': {'1': {'banned_words': ['a']}}})
+        await watcher.check()
+        assert manager.get_guild_config('1')['banned_words'] == ['a', 'c']
+
+    _run(tmp_path, scenario)
@@ -0,0 +1,56 @@
+import random
+import string
+
+from utils.fingerprint import FingerprintStore, normalize_text
+
+SPAM = [
+    "FREE NITRO giveaway click here now to claim your reward before it expires discord gift",
+    "Hey everyone check out my new crypto trading server with daily signals and huge profits",
+    "今すぐこちらのリンクから無料でNitroを受け取ってください。期間限定のプレゼントです。",
+]
+
+def _add(store, text, channel_id, user_id=1):
+    return store.add(normalize_text(text), 1, channel_id, user_id)
+
+def test_random_suffix_joins_cluster():
+    rng = random.Random(0)
+    for text in SPAM:
+        for _ in range(20):
+            store = FingerprintStore()
+            _add(store, text, 1)
+            suffix = ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(6))
+            assert len(_add(store, f"{text} {suffix}", 2).occurrences) == 2
+
+def test_one_changed_word_joins_cluster():
+    rng = random.Random(0)
+    for text in SPAM[:2]:
+        words = text.split()
+        for _ in range(20):
+            store = FingerprintStore()
+            _add(store, text, 1)
+            changed = list(words)
+            index = rng.randrange(len(changed))
+            changed[index] = ''.join(rng.choice(string.ascii_lowercase) for _ in range(len(changed[index])))
+            assert len(_add(store, ' '.join(changed), 2).occurrences) == 2
+
+    store = FingerprintStore()
+    _add(store, SPAM[2], 1)
+    assert len(_add(store, SPAM[2].replace("無料", "タダ"), 2).occurrences) == 2
+
+def test_unrelated_messages_stay_apart():
+    store = FingerprintStore()
+    for channel_id, text in enumerate(SPAM):
+        assert len(_add(store, text, channel_id).occurrences) == 1
+    assert len(store) == len(SPAM)
+
+    rng = random.Random(0)
+    words = (
+        "the of and to in is you that it he was for on are as with his they at be this have from or "
+        "one had by word but not what all were we when your can said there use an each which she do"
+    ).split()
+    store = FingerprintStore()
+    for index in range(200):
+        text = ' '.join(rng.choice(words) for _ in range(12))
+        _add(store, text, index, index)
+    # 無作為な文どうしはほとんど同じクラスタにならない
+    assert len(store) >= 195
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from utils.reputation import ReputationStore
+
+class FakeDatabase:
+    def __init__(self, rows=None):
+        self.rows = dict(rows or {})
+
+    async def get_reputation(self, user_id):
+        return self.rows.get(user_id)
+
+    async def save_reputations(self, rows):
+        for row in rows:
+            self.rows[row[0]] = row
+
+def test_one_incident_tightens_other_guilds():
+    async def main():
+        store = ReputationStore(FakeDatabase())
+        assert store.tightened(5, 42) == 5
+        # ギルドAで1回対処
+        await store.record_incident(42, guild_id=1)
+        # ギルドBの閾値（既定の message_count=5, mention_limit=15）が下がる
+        assert store.tightened(5, 42) == 3
+        assert store.tightened(15, 42) == 8
+        # 他のユーザーには影響しない
+        assert store.tightened(5, 43) == 5
+
+    asyncio.run(main())
+
+def test_tightening_is_bounded():
+    async def main():
+        store = ReputationStore(FakeDatabase())
+        for _ in range(10):
+            await store.record_incident(42, guild_id=1)
+        assert store.tightened(5, 42) == 3
+        assert store.tightened(15, 42) == 5
+        assert store.tightened(2, 42) == 2
+
+    asyncio.run(main())
+
+def test_record_incident_adds_to_stored_row():
+    async def main():
+        database = FakeDatabase({42: (42, 3.0, 3, 1, int(time.time()))})
+        store = ReputationStore(database)
+        await store.record_incident(42, guild_id=2)
+        await store.flush()
+        _, score, incidents, guild_id, _ = database.rows[42]
+        assert incidents == 4 and guild_id == 2
+        assert score > 3.0
+
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+import aiohttp
+
+# 同じメタデータのファイル名違いを比べるときに取得する先頭のバイト数
+PREFIX_BYTES = 64 * 1024
+# 1つのメタデータに覚えておくファイル名の数
+MAX_STEMS_PER_GROUP = 32
+
+def _stem(filename: str) -> str:
+    return os.path.splitext(filename)[0].casefold()
+
+class _Group:
+    """サイズ・寸法・形式が同じ添付ファイルの集まり"""
+
+    __slots__ = ('rep_key', 'rep_url', 'rep_hash', 'stems', 'hashes', 'last_seen')
+
+    def __init__(self, rep_key: Hashable, rep_url: str, stem: str, now: float):
+        self.rep_key = rep_key
+        self.rep_url = rep_url
+        self.rep_hash: Optional[str] = None
+        self.stems: Dict[str, Hashable] = {stem: rep_key}
+        self.hashes: Dict[str, Hashable] = {}
+        self.last_seen = now
+
+class AttachmentFingerprinter:
+    """
+    添付ファイルの指紋と、指紋ごとの最近の出現記録
+
+    指紋はまずメタデータ（サイズ・幅・高さ・content_type）とファイル名から作る。
+    メタデータが一致してファイル名だけが違う場合に限り、共有のHTTPセッションで先頭
+    PREFIX_BYTES バイトを取得してハッシュを比べる。ほとんどの添付ファイルはダウンロードしない。
+    指紋と出現記録は ttl 秒で期限切れにし、件数も max_entries までに抑える。
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, ttl: float = 60.0, max_entries: int = 20000,
+                 max_occurrences: int = 50, clock: Callable[[], float] = time.monotonic):
+        self.session = session
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_occurrences = max_occurrences
+        self.clock = clock
+        self.logger = logging.getLogger('bot.attachments')
+        self._groups: 'OrderedDict[Tuple, _Group]' = OrderedDict()
+        self._occurrences: 'OrderedDict[Hashable, Deque]' = OrderedDict()
+        self.downloads = 0
+
+    def _expire(self, cache: OrderedDict, now: float, last_seen: Callable[[Any], float]) -> None:
+        cutoff = now - self.ttl
+        while cache:
+            key, value = next(iter(cache.items()))
+            if last_seen(value) > cutoff and len(cache) <= self.max_entries:
+                break
+            del cache[key]
+
+    async def _prefix_hash(self, url: str) -> Optional[str]:
+        """ファイルの先頭 PREFIX_BYTES バイトのハッシュ（取得できない場合はNone）"""
+        try:
+            headers = {'Range': f'bytes=0-{PREFIX_BYTES - 1}'}
+            async with self.session.get(url, headers=headers) as response:
+                if response.status not in (200, 206):
+                    return None
+                data = await response.content.read(PREFIX_BYTES)
+            self.downloads += 1
+            return hashlib.blake2b(data, digest_size=16).hexdigest()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.debug(f"添付ファイルの取得に失敗しました: {e}")
+            return None
+
+    async def fingerprint(self, attachment) -> Hashable:
+        """添付ファイル（discord.Attachment）の指紋を返す"""
+        now = self.clock()
+        self._expire(self._groups, now, lambda group: group.last_seen)
+        meta = (attachment.size, attachment.width, attachment.height, attachment.content_type)
+        stem = _stem(attachment.filename)
+
+        group = self._groups.get(meta)
+        if group is None:
+            key = (meta, stem)
+            self._groups[meta] = _Group(key, attachment.url, stem, now)
+            return key
+        group.last_seen = now
+        self._groups.move_to_end(meta)
+
+        key = group.stems.get(stem)
+        if key is not None:
+            return key
+
+        # メタデータが一致してファイル名が違う場合だけ、内容の先頭を比べる
+        digest = await self._prefix_hash(attachment.url)
+        if digest is None:
+            key = (meta, stem)
+        else:
+            if group.rep_hash is None:
+                group.rep_hash = await self._prefix_hash(group.rep_url)
+            key = group.hashes.get(digest)
+            if key is None:
+                key = group.rep_key if digest == group.rep_hash else (meta, digest)
+                group.hashes[digest] = key
+        if len(group.stems) < MAX_STEMS_PER_GROUP:
+            group.stems[stem] = key
+        return key
+
+    def record(self, key: Hashable, guild_id: int, channel_id: int, user_id: int, data: Any = None) -> Deque:
+        """指紋の出現を記録し、ttl 秒以内の出現 (時刻, guild_id, channel_id, user_id, data) を返す"""
+        now = self.clock()
+        self._expire(self._occurrences, now, lambda occurrences: occurrences[-1][0])
+        occurrences = self._occurrences.get(key)
+        if occurrences is None:
+            occurrences = self._occurrences[key] = deque(maxlen=self.max_occurrences)
+        else:
+            self._occurrences.move_to_end(key)
+        cutoff = now - self.ttl
+        while occurrences and occurrences[0][0] <= cutoff:
+            occurrences.popleft()
+        occurrences.append((now, guild_id, channel_id, user_id, data))
+        return occurrences
+
+    def stats(self) -> Dict[str, int]:
+        return {'groups': len(self._groups), 'fingerprints': len(self._occurrences), 'downloads': self.downloads}
@@ -1,39 +1,152 @@
+import asyncio
+import copy
 import json
 import os
 import logging
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Any, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from .config_store import SqliteConfigStore
+from .guild_settings import DEFAULT_SPAM_SETTINGS, GuildSettings
+
+class ConfigChange(NamedTuple):
+    """設定の変更通知"""
+    guild_id: Optional[int]  # グローバル設定の変更ではNone
+    keys: FrozenSet[str]     # 変更されたキー
+
+ConfigListener = Callable[[ConfigChange], None]
+
+# apply_changes() でキーを削除することを表す値
+REMOVED = object()
+
+class MergeChanges(dict):
+    """apply_changes() で、値を置き換えずに既存の辞書へキーごとに反映する変更"""
+
+def _apply_updates(target: dict, updates: Dict[str, Any]) -> None:
+    for key, value in updates.items():
+        if value is REMOVED:
+            target.pop(key, None)
+        elif isinstance(value, MergeChanges):
+            # 既存の辞書は他から参照されている可能性があるため、コピーに反映して差し替える
+            current = target.get(key)
+            merged = dict(current) if isinstance(current, dict) else {}
+            _apply_updates(merged, value)
+            target[key] = merged
+        else:
+            target[key] = value
 
 class ConfigManager:
-    def __init__(self, config_file: str = 'config.json'):
+    """
+    ギルド・グローバル設定の読み書きを行う
+
+    Botにつき1インスタンスを bot.config_manager として共有する。
+    設定は SqliteConfigStore（config.db）にギルドごとに1行ずつ保存し、
+    ギルドの設定は最初にアクセスされたときに読み込む。
+    保存は save_delay 秒の間の変更をまとめ、変更のあったギルドの行だけを
+    専用のワーカースレッドで書き込む。
+    旧形式の config.json がある場合は初回起動時に一度だけ取り込む。
+
+    設定が変わると subscribe() で登録された関数に ConfigChange を渡すので、
+    各Cogはメッセージごとに設定を読み直さず、変更時にだけ派生データを作り直せばよい。
+    """
+
+    IMPORT_META_KEY = 'imported_config_json'
+
+    def __init__(self, config_file: str = 'config.json', store_path: str = 'config.db',
+                 save_delay: float = 1.0):
         self.config_file = config_file
+        self.save_delay = save_delay
         self.logger = logging.getLogger('bot.configmanager')
-        self.config = self._load_config()
+        self.store = SqliteConfigStore(store_path)
+        self._import_legacy_config()
+        # guilds には読み込み済みのギルドだけが入る
+        self.config = {
+            'guilds': {},
+            'global': self.store.load_global() or self._default_global_config()
+        }
+        self._missing_guilds: Set[str] = set()
+        self._dirty_guilds: Set[str] = set()
+        self._global_dirty = False
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self._save_future: Optional[asyncio.Future] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='config-save')
+        self._listeners: List[ConfigListener] = []
+        self._settings: Dict[int, GuildSettings] = {}
+
+    def subscribe(self, listener: ConfigListener) -> None:
+        """設定変更の通知を受け取る関数を登録する"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ConfigListener) -> None:
+        """登録した関数を解除する（Cogのアンロード時など）"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _publish(self, guild_id: Optional[str], keys) -> None:
+        """登録された関数へ変更を通知する（1つが失敗しても他には通知する）"""
+        change = ConfigChange(int(guild_id) if guild_id is not None else None, frozenset(keys))
+        # 通知先が新しい設定を読めるよう、先にキャッシュを破棄する
+        if change.guild_id is None:
+            self._settings.clear()
+        else:
+            self._settings.pop(change.guild_id, None)
+        for listener in list(self._listeners):
+            try:
+                listener(change)
+            except Exception as e:
+                self.logger.error(f"Error in config listener {listener!r}: {e}")
 
-    def _load_config(self) -> dict:
-        """設定ファイルを読み込む"""
+    @staticmethod
+    def _default_global_config() -> dict:
+        return {
+            'log_channels': {},
+            'vc_log_channels': {},
+            'photo_archive_channel': None,  # グローバル設定に移動
+            'banned_words': [],
+            'spam_settings': dict(DEFAULT_SPAM_SETTINGS)
+        }
+
+    def _load_config(self) -> Optional[dict]:
+        """旧形式の設定ファイルを読み込む（存在しない場合はNone）"""
         try:
             if os.path.exists(self.config_file):
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     return json.load(f)
-            else:
-                return {
-                    'guilds': {},
-                    'global': {
-                        'log_channels': {},
-                        'vc_log_channels': {},
-                        'photo_archive_channel': None,  # グローバル設定に移動
-                        'banned_words': [],
-                        'spam_settings': {
-                            'message_count': 5,
-                            'time_window': 5,
-                            'action': 'timeout',
-                            'timeout_duration': 300
-                        }
-                    }
-                }
         except Exception as e:
             self.logger.error(f"Error loading config: {e}")
-            return {'guilds': {}, 'global': {}}
+        return None
+
+    def _import_legacy_config(self) -> None:
+        """config.json の内容をストアへ一度だけ取り込む"""
+        if self.store.get_meta(self.IMPORT_META_KEY) is not None:
+            return
+        legacy = self._load_config()
+        if legacy is not None:
+            count = self.store.import_config(legacy)
+            self.logger.info(f"Imported {count} guild configs from {self.config_file}")
+        self.store.set_meta(self.IMPORT_META_KEY, datetime.now().isoformat(timespec='seconds'))
+
+    def _load_guild(self, guild_id: str) -> Optional[dict]:
+        """ギルドの設定をキャッシュから、なければストアから読み込む"""
+        guilds = self.config['guilds']
+        if guild_id in guilds:
+            return guilds[guild_id]
+        if guild_id in self._missing_guilds:
+            return None
+        try:
+            data = self.store.load_guild(int(guild_id))
+        except (TypeError, ValueError):
+            data = None
+        except Exception as e:
+            self.logger.error(f"Error loading guild config {guild_id}: {e}")
+            return None
+        if data is None:
+            self._missing_guilds.add(guild_id)
+            return None
+        guilds[guild_id] = data
+        return data
 
     def set_archive_channel(self, channel_id: int) -> bool:
         """アーカイブチャンネルをグローバルに設定"""
@@ -42,7 +155,9 @@ class ConfigManager:
                 self.config['global'] = {}
             
             self.config['global']['photo_archive_channel'] = channel_id
-            return self._save_config()
+            saved = self._save_config()
+            self._publish(None, ('photo_archive_channel',))
+            return saved
         except Exception as e:
             self.logger.error(f"Error setting archive channel: {e}")
             return False
@@ -52,44 +167,108 @@ class ConfigManager:
         return self.config.get('global', {}).get('photo_archive_channel')
 
 
-    def _save_config(self) -> bool:
-        """設定をファイルに保存する"""
+    def _save_config(self, guild_id: Optional[str] = None) -> bool:
+        """
+        設定の保存を予約する
+
+        guild_id を指定した場合はそのギルドの行を、省略した場合はグローバル設定を保存する。
+        イベントループ上では save_delay 秒後にまとめて保存するため、
+        戻り値は保存の予約に成功したかどうかを表す。
+        ループの外（起動前など）ではその場で書き込み、その結果を返す。
+        """
+        if guild_id is None:
+            self._global_dirty = True
+        else:
+            self._dirty_guilds.add(guild_id)
+
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=4, ensure_ascii=False)
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self._write_config(*self._take_snapshot())
+
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(self.save_delay, self._start_save)
+        return True
+
+    def _take_snapshot(self) -> Tuple[Dict[int, dict], Optional[dict]]:
+        """変更のあった設定のコピーを取り出し、変更済みの印を消す"""
+        guilds = {
+            int(guild_id): copy.deepcopy(self.config['guilds'][guild_id])
+            for guild_id in self._dirty_guilds
+            if guild_id in self.config['guilds']
+        }
+        global_config = copy.deepcopy(self.config['global']) if self._global_dirty else None
+        self._dirty_guilds.clear()
+        self._global_dirty = False
+        return guilds, global_config
+
+    def _start_save(self):
+        """予約された保存を開始する（その時点の変更のコピーをワーカーへ渡す）"""
+        self._save_handle = None
+        guilds, global_config = self._take_snapshot()
+        loop = asyncio.get_running_loop()
+        self._save_future = loop.run_in_executor(self._executor, self._write_config, guilds, global_config)
+
+    def _write_config(self, guilds: Dict[int, dict], global_config: Optional[dict]) -> bool:
+        """変更のあった行だけをストアへ書き込む（ワーカースレッドで実行）"""
+        try:
+            self.store.save(guilds, global_config)
             return True
         except Exception as e:
             self.logger.error(f"Error saving config: {e}")
             return False
 
+    async def flush(self) -> bool:
+        """予約中の保存をすぐに実行し、書き込みの完了を待つ"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._start_save()
+        if self._save_future is not None:
+            return await self._save_future
+        return True
+
+    async def close(self):
+        """未保存の変更を書き込み、ワーカーを停止する"""
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        self.store.close()
+
     def has_guild(self, guild_id: str) -> bool:
         """ギルドの設定が存在するか確認"""
-        return guild_id in self.config.get('guilds', {})
+        return self._load_guild(guild_id) is not None
 
     def initialize_guild(self, guild_id: str) -> None:
         """ギルドの初期設定を作成"""
-        if 'guilds' not in self.config:
-            self.config['guilds'] = {}
-        
-        if guild_id not in self.config['guilds']:
+        if not self.has_guild(guild_id):
+            self._missing_guilds.discard(guild_id)
             self.config['guilds'][guild_id] = {
                 'photo_archive_channel': None,
                 'log_channel': None,
                 'vc_log_channel': None,
                 'mod_log_channel': None,
                 'banned_words': [],
-                'spam_settings': {
-                    'message_count': 5,
-                    'time_window': 5,
-                    'action': 'timeout',
-                    'timeout_duration': 300
-                }
+                'spam_settings': dict(DEFAULT_SPAM_SETTINGS)
             }
-            self._save_config()
+            self._save_config(guild_id)
+            self._publish(guild_id, self.config['guilds'][guild_id].keys())
+
+    def get_settings(self, guild_id: int) -> GuildSettings:
+        """
+        ギルドの設定を GuildSettings として取得する
+
+        設定が変わるまでは同じオブジェクトを返す（ギルドの設定がない場合も既定値で作る）。
+        """
+        settings = self._settings.get(guild_id)
+        if settings is None:
+            settings = GuildSettings.from_config(
+                guild_id, self._load_guild(str(guild_id)), self.config['global']
+            )
+            self._settings[guild_id] = settings
+        return settings
 
     def get_guild_config(self, guild_id: str) -> Optional[dict]:
         """ギルドの設定を取得"""
-        return self.config.get('guilds', {}).get(guild_id)
+        return self._load_guild(guild_id)
 
     def update_guild_config(self, guild_id: str, updates: Dict[str, Any]) -> bool:
         """
@@ -114,11 +293,50 @@ class ConfigManager:
             for key, value in updates.items():
                 self.config['guilds'][guild_id][key] = value
             
-            return self._save_config()
+            saved = self._save_config(guild_id)
+            self._publish(guild_id, updates.keys())
+            return saved
         except Exception as e:
             self.logger.error(f"Error updating guild config: {e}")
             return False
 
+    def apply_changes(self, changes: Dict[Optional[str], Dict[str, Any]]) -> List[ConfigChange]:
+        """
+        複数のギルド・グローバル設定の変更をまとめて反映する（設定ファイルの再読み込み用）
+
+        すべての変更を反映してから保存を予約し、通知を送る。途中で await しないため、
+        他の処理から変更の途中の状態が見えることはない。
+
+        Parameters
+        ----------
+        changes : Dict[Optional[str], Dict[str, Any]]
+            ギルドID（グローバル設定はNone）-> 変更するキーと値。値が REMOVED のキーは削除し、
+            MergeChanges のキーは既存の辞書にキーごとに反映する
+
+        Returns
+        -------
+        List[ConfigChange]
+            通知した変更
+        """
+        applied = []
+        for guild_id, updates in changes.items():
+            if not updates:
+                continue
+            if guild_id is None:
+                target = self.config['global']
+            else:
+                target = self._load_guild(guild_id)
+                if target is None:
+                    self._missing_guilds.discard(guild_id)
+                    target = self.config['guilds'][guild_id] = {}
+            _apply_updates(target, updates)
+            self._save_config(guild_id)
+            applied.append((guild_id, updates.keys()))
+
+        for guild_id, keys in applied:
+            self._publish(guild_id, keys)
+        return [ConfigChange(int(g) if g is not None else None, frozenset(k)) for g, k in applied]
+
     def get_global_config(self) -> dict:
         """グローバル設定を取得"""
         return self.config.get('global', {})
@@ -132,17 +350,14 @@ class ConfigManager:
             for key, value in updates.items():
                 self.config['global'][key] = value
             
-            return self._save_config()
+            saved = self._save_config()
+            self._publish(None, updates.keys())
+            return saved
         except Exception as e:
             self.logger.error(f"Error updating global config: {e}")
             return False
     
     def get_default_settings(self) -> dict:
         return {
-            'spam_settings': {
-                'message_count': 5,
-                'time_window': 5,
-                'action': 'timeout',
-                'timeout_duration': 300
-            }
+            'spam_settings': dict(DEFAULT_SPAM_SETTINGS)
         }            
@@ -0,0 +1,110 @@
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+class SqliteConfigStore:
+    """
+    ギルドごとの設定を1行ずつ（JSON）保存するSQLiteのストア
+
+    ギルドの設定を更新しても、書き込まれるのはそのギルドの行だけになる。
+    読み込み（イベントループ）と書き込み（ConfigManagerのワーカースレッド）は別々の接続を使う。
+    WALモードでは書き込み中でも読み込めるため、ワーカーのコミットや fsync の間も
+    イベントループが待たされることはない。各接続はそれぞれのロックで直列化する。
+    """
+
+    def __init__(self, path: str = 'config.db'):
+        self.path = path
+        self.logger = logging.getLogger('bot.configstore')
+        self._lock = threading.Lock()       # 書き込み用の接続
+        self._read_lock = threading.Lock()  # 読み込み用の接続
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            with self._conn:
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS guild_config (
+                        guild_id INTEGER PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        updated_at TEXT NOT NULL
+                    )
+                ''')
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS global_config (
+                        id INTEGER PRIMARY KEY CHECK (id = 0),
+                        data TEXT NOT NULL,
+                        updated_at TEXT NOT NULL
+                    )
+                ''')
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS config_meta (
+                        key TEXT PRIMARY KEY,
+                        value TEXT
+                    )
+                ''')
+        self._read_conn = sqlite3.connect(path, check_same_thread=False)
+
+    def load_guild(self, guild_id: int) -> Optional[dict]:
+        """ギルドの設定を読み込む（存在しない場合はNone）"""
+        with self._read_lock:
+            row = self._read_conn.execute(
+                'SELECT data FROM guild_config WHERE guild_id = ?', (guild_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_global(self) -> Optional[dict]:
+        with self._read_lock:
+            row = self._read_conn.execute('SELECT data FROM global_config WHERE id = 0').fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, guilds: Dict[int, dict], global_config: Optional[dict] = None) -> None:
+        """
+        変更のあったギルドと（指定された場合は）グローバル設定だけを1トランザクションで保存する
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        rows = [(guild_id, json.dumps(data, ensure_ascii=False), now) for guild_id, data in guilds.items()]
+        with self._lock, self._conn:
+            if rows:
+                self._conn.executemany('''
+                    INSERT INTO guild_config (guild_id, data, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(guild_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                ''', rows)
+            if global_config is not None:
+                self._conn.execute('''
+                    INSERT INTO global_config (id, data, updated_at) VALUES (0, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                ''', (json.dumps(global_config, ensure_ascii=False), now))
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._read_lock:
+            row = self._read_conn.execute('SELECT value FROM config_meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT INTO config_meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            ''', (key, value))
+
+    def import_config(self, config: dict) -> int:
+        """
+        config.json 形式の辞書をまとめて取り込む
+
+        Returns
+        -------
+        int
+            取り込んだギルド数
+        """
+        guilds = {int(guild_id): data for guild_id, data in config.get('guilds', {}).items()}
+        self.save(guilds, config.get('global'))
+        return len(guilds)
+
+    def close(self) -> None:
+        with self._read_lock:
+            self._read_conn.close()
+        with self._lock:
+            self._conn.close()
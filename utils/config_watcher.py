@@ -0,0 +1,314 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config_manager import REMOVED, ConfigChange, ConfigManager, MergeChanges
+from .guild_settings import SPAM_ACTIONS, SPAM_WINDOW_LIMITS, VERIFICATION_LEVELS
+
+# 値がチャンネルID（int / 数字の文字列 / None）であるべきキー
+_CHANNEL_KEYS = ('photo_archive_channel', 'log_channel', 'vc_log_channel', 'mod_log_channel')
+
+class ConfigValidationError(ValueError):
+    """設定ファイルの内容が不正"""
+
+def _check_channel_id(where: str, value: Any) -> None:
+    if value is None:
+        return
+    if isinstance(value, bool) or not (isinstance(value, int) or (isinstance(value, str) and value.isdigit())):
+        raise ConfigValidationError(f"{where}: チャンネルIDが不正です: {value!r}")
+
+def _check_section(where: str, section: Any) -> None:
+    """ギルド設定またはグローバル設定の1セクションを検証する"""
+    if not isinstance(section, dict):
+        raise ConfigValidationError(f"{where}: オブジェクトではありません")
+    for key in _CHANNEL_KEYS:
+        _check_channel_id(f"{where}.{key}", section.get(key))
+
+    banned_words = section.get('banned_words')
+    if banned_words is not None and (
+        not isinstance(banned_words, list) or not all(isinstance(word, str) for word in banned_words)
+    ):
+        raise ConfigValidationError(f"{where}.banned_words: 文字列のリストではありません")
+
+    raid = section.get('raid_settings')
+    if raid is not None:
+        if not isinstance(raid, dict):
+            raise ConfigValidationError(f"{where}.raid_settings: オブジェクトではありません")
+        for key in ('join_threshold', 'join_window', 'new_account_days', 'lockdown_duration',
+                    'slowmode', 'timeout_duration'):
+            value = raid.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+                raise ConfigValidationError(f"{where}.raid_settings.{key}: 0以上の整数ではありません: {value!r}")
+        if 'verification_level' in raid and raid['verification_level'] not in VERIFICATION_LEVELS:
+            raise ConfigValidationError(
+                f"{where}.raid_settings.verification_level: {raid['verification_level']!r} は使用できません"
+            )
+
+    slowmode = section.get('slowmode_settings')
+    if slowmode is not None:
+        if not isinstance(slowmode, dict):
+            raise ConfigValidationError(f"{where}.slowmode_settings: オブジェクトではありません")
+        for key in ('rate_threshold', 'author_threshold', 'max_delay', 'hold_time', 'max_edits_per_hour'):
+            value = slowmode.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+                raise ConfigValidationError(f"{where}.slowmode_settings.{key}: 正の整数ではありません: {value!r}")
+
+    spam = section.get('spam_settings')
+    if spam is None:
+        return
+    if not isinstance(spam, dict):
+        raise ConfigValidationError(f"{where}.spam_settings: オブジェクトではありません")
+    for key in ('message_count', 'time_window', 'timeout_duration', 'purge_window', 'mention_limit',
+                'mention_window'):
+        value = spam.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+            raise ConfigValidationError(f"{where}.spam_settings.{key}: 正の整数ではありません: {value!r}")
+    for key, limit in SPAM_WINDOW_LIMITS.items():
+        value = spam.get(key)
+        if isinstance(value, int) and value > limit:
+            raise ConfigValidationError(f"{where}.spam_settings.{key}: {limit}秒以下にしてください: {value!r}")
+    if 'action' in spam and spam['action'] not in SPAM_ACTIONS:
+        raise ConfigValidationError(f"{where}.spam_settings.action: {spam['action']!r} は使用できません")
+
+def validate_config(config: Any) -> None:
+    """config.json 形式の内容を検証する（不正な場合は ConfigValidationError）"""
+    if not isinstance(config, dict):
+        raise ConfigValidationError("トップレベルがオブジェクトではありません")
+    guilds = config.get('guilds', {})
+    if not isinstance(guilds, dict):
+        raise ConfigValidationError("guilds: オブジェクトではありません")
+    for guild_id, section in guilds.items():
+        if not guild_id.isdigit():
+            raise ConfigValidationError(f"guilds: ギルドIDが不正です: {guild_id!r}")
+        _check_section(f"guilds.{guild_id}", section)
+    if 'global' in config:
+        _check_section('global', config['global'])
+
+def _diff_section(old: dict, new: dict) -> Dict[str, Any]:
+    """
+    変更・追加されたキーの新しい値と、削除されたキー（REMOVED）
+
+    値が辞書（spam_settings など）のキーは丸ごと置き換えず、中の変更されたキーだけを
+    MergeChanges として返す。ファイルにない値（コマンドで変更したものなど）を古い値で上書きしないため。
+    """
+    changes: Dict[str, Any] = {}
+    for key, value in new.items():
+        previous = old.get(key, REMOVED)
+        if previous == value:
+            continue
+        if isinstance(value, dict):
+            nested = _diff_section(previous if isinstance(previous, dict) else {}, value)
+            if nested:
+                changes[key] = MergeChanges(nested)
+        else:
+            changes[key] = value
+    changes.update({key: REMOVED for key in old if key not in new})
+    return changes
+
+def diff_config(old: dict, new: dict) -> Dict[Optional[str], Dict[str, Any]]:
+    """
+    2つの config.json の内容の差分を ConfigManager.apply_changes() の形式で返す
+
+    ファイルから削除されたギルドは無視する（ギルドの設定はDB側が正のため）。
+    """
+    changes: Dict[Optional[str], Dict[str, Any]] = {}
+    old_guilds = old.get('guilds', {})
+    for guild_id, section in new.get('guilds', {}).items():
+        section_changes = _diff_section(old_guilds.get(guild_id, {}), section)
+        if section_changes:
+            changes[guild_id] = section_changes
+    global_changes = _diff_section(old.get('global', {}), new.get('global', {}))
+    if global_changes:
+        changes[None] = global_changes
+    return changes
+
+def _rebase_section(changes: Dict[str, Any], old: dict, current: dict, where: str,
+                    conflicts: List[str]) -> Dict[str, Any]:
+    """
+    ファイルの差分を、ストアの現在の値（コマンドで変更されている可能性がある）に合わせて組み直す
+
+    - リストは前回の内容から追加・削除された要素だけを現在のリストに反映する（/addword の追加を消さない）
+    - それ以外の値は、現在の値が前回のファイルの値と異なる場合（コマンドでも変更されている）は衝突として反映しない
+    """
+    rebased: Dict[str, Any] = {}
+    for key, value in changes.items():
+        previous = old.get(key, REMOVED)
+        present = current.get(key, REMOVED)
+        if isinstance(value, MergeChanges):
+            nested = _rebase_section(
+                value,
+                previous if isinstance(previous, dict) else {},
+                present if isinstance(present, dict) else {},
+                f"{where}.{key}",
+                conflicts
+            )
+            if nested:
+                rebased[key] = MergeChanges(nested)
+        elif isinstance(value, list):
+            before = previous if isinstance(previous, list) else []
+            base = present if isinstance(present, list) else []
+            added = [item for item in value if item not in before]
+            merged = [item for item in base if item not in before or item in value]
+            merged += [item for item in added if item not in merged]
+            if merged != base or present is REMOVED:
+                rebased[key] = merged
+        elif present is not REMOVED and present != previous:
+            if present != value:
+                conflicts.append(f"{where}.{key}")
+        else:
+            rebased[key] = value
+    return rebased
+
+def rebase_changes(changes: Dict[Optional[str], Dict[str, Any]], old: dict, config_manager: ConfigManager,
+                   conflicts: List[str]) -> Dict[Optional[str], Dict[str, Any]]:
+    """
+    diff_config() の結果を現在の設定に合わせて組み直す（衝突したキーは conflicts に追加して除く）
+
+    Botは config.json を書き戻さないため、ファイルの内容はコマンドによる変更を含まない。
+    ファイルで変更された部分だけを、コマンドによる変更を上書きしない形で反映する。
+    """
+    rebased: Dict[Optional[str], Dict[str, Any]] = {}
+    for guild_id, section_changes in changes.items():
+        if guild_id is None:
+            section_old = old.get('global', {})
+            current = config_manager.get_global_config()
+            where = 'global'
+        else:
+            section_old = old.get('guilds', {}).get(guild_id, {})
+            current = config_manager.get_guild_config(guild_id) or {}
+            where = f"guilds.{guild_id}"
+        section = _rebase_section(section_changes, section_old, current, where, conflicts)
+        if section:
+            rebased[guild_id] = section
+    return rebased
+
+class ConfigWatcher:
+    """
+    config.json の手動編集を再起動なしで反映する
+
+    poll_interval 秒ごとにファイルの更新時刻とサイズを確認し、変わっていれば読み込んで検証する。
+    前回読み込んだ内容との差分（変更されたギルドとキー）だけを ConfigManager.apply_changes() で
+    まとめて反映するので、コマンドによる変更と同じ通知が送られる。
+    内容が不正な場合は何も反映せず、ファイルが直されるまで前回の内容を基準にする。
+
+    最後に反映した内容はストアの config_meta に保存しておき、起動時にはそれとの差分を反映する。
+    そのため、Botの停止中にファイルを編集しても再起動で反映される。
+    """
+
+    APPLIED_META_KEY = 'applied_config_json'
+
+    def __init__(self, config_manager: ConfigManager, poll_interval: float = 5.0):
+        self.config_manager = config_manager
+        self.path = config_manager.config_file
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger('bot.configwatcher')
+        self._signature: Optional[Tuple[int, int]] = None
+        self._last_config: dict = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self) -> dict:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load_applied(self) -> Optional[dict]:
+        value = self.config_manager.store.get_meta(self.APPLIED_META_KEY)
+        return json.loads(value) if value is not None else None
+
+    async def _remember(self, config: dict) -> None:
+        """反映済みの内容として保存する（次回起動時の比較の基準）"""
+        self._last_config = config
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.config_manager.store.set_meta, self.APPLIED_META_KEY, json.dumps(config, ensure_ascii=False)
+        )
+
+    def _apply(self, old: dict, config: dict) -> List[ConfigChange]:
+        """前回の内容 old から config への変更を、コマンドによる変更を残したまま反映する"""
+        conflicts: List[str] = []
+        changes = rebase_changes(diff_config(old, config), old, self.config_manager, conflicts)
+        if conflicts:
+            self.logger.warning(
+                f"{self.path} の次の項目はコマンドでも変更されているため反映しませんでした: {', '.join(conflicts)}"
+            )
+        if not changes:
+            return []
+        return self.config_manager.apply_changes(changes)
+
+    async def start(self) -> None:
+        """
+        停止中のファイルの変更を反映してから監視を開始する
+
+        反映済みの内容が保存されていない場合（初回起動時は config.json をそのまま取り込んでいる）は、
+        現在のファイルの内容を基準とする。
+        """
+        loop = asyncio.get_running_loop()
+        self._signature = self._stat()
+        if self._signature is not None:
+            try:
+                config = await loop.run_in_executor(None, self._read)
+                validate_config(config)
+                applied = await loop.run_in_executor(None, self._load_applied)
+                if applied is not None and self._apply(applied, config):
+                    self.logger.info(f"停止中の {self.path} の変更を反映しました")
+                await self._remember(config)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"{self.path} を基準として読み込めませんでした: {e}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch_loop())
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.check()
+            except Exception as e:
+                self.logger.error(f"設定ファイルの確認中にエラーが発生しました: {e}")
+
+    async def check(self) -> int:
+        """
+        ファイルが変わっていれば読み込んで反映する
+
+        Returns
+        -------
+        int
+            反映したギルド・グローバル設定の数
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return 0
+        self._signature = signature
+
+        try:
+            config = await asyncio.get_running_loop().run_in_executor(None, self._read)
+            validate_config(config)
+        except (OSError, ValueError) as e:
+            # 書き込み途中の可能性もあるため、次に変わったときに再度読み込む
+            self.logger.error(f"{self.path} を反映しませんでした: {e}")
+            return 0
+
+        applied = self._apply(self._last_config, config)
+        await self._remember(config)
+        if not applied:
+            return 0
+        self.logger.info(
+            f"{self.path} の変更を反映しました: "
+            + ', '.join('global' if c.guild_id is None else str(c.guild_id) for c in applied)
+        )
+        return len(applied)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,187 @@
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# 記号・空白・制御文字（比較時に無視する）
+_IGNORED = re.compile(r'[\W_]+', re.UNICODE)
+_URL = re.compile(r'https?://\S+')
+
+SHINGLE_SIZE = 3
+# 指紋の計算に使う正規化後の最大文字数（長文でも計算量を一定に抑える）
+MAX_SHINGLE_CHARS = 512
+# MinHash の署名の長さ。LSH_BANDS 個の帯に LSH_ROWS 個ずつ分ける
+MINHASH_PERMUTATIONS = 64
+LSH_ROWS = 4
+LSH_BANDS = MINHASH_PERMUTATIONS // LSH_ROWS
+# 3-gramの集合の Jaccard 係数がこれ以上なら同じ本文とみなす。
+# 帯が一致する確率は 1-(1-J^4)^16 で、J=0.5 なら約65%、J=0.7 なら約98%、J=0.3 なら約12%（候補は署名で再確認する）
+DEFAULT_MIN_SIMILARITY = 0.5
+
+# 各置換 h(x) = x XOR m のマスク（起動ごとに変わらないよう固定のシードから作る）。
+# 3-gramのハッシュは一様なので、XOR の置換で十分に独立な最小値が得られ、乗算より数倍速い
+_PERMUTATION_MASKS = [
+    int.from_bytes(hashlib.blake2b(f"minhash{i}".encode(), digest_size=8).digest(), 'big')
+    for i in range(MINHASH_PERMUTATIONS)
+]
+
+def normalize_text(content: str) -> str:
+    """
+    比較用に本文を正規化する（NFKC・大文字小文字の統一・記号と空白の除去）
+
+    URLはクエリやパスを変えて重複判定を逃れられないよう、ホスト名だけを残す。
+    """
+    text = _URL.sub(lambda m: m.group(0).split('/')[2], content)
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return _IGNORED.sub('', text)
+
+def _hash64(data: str) -> int:
+    return int.from_bytes(hashlib.blake2b(data.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def content_hash(normalized: str) -> int:
+    """正規化済みの本文の完全一致用のハッシュ"""
+    return _hash64(normalized)
+
+def shingles(normalized: str) -> Set[str]:
+    """正規化済みの本文の文字3-gramの集合（分かち書きのない日本語でも使える）"""
+    text = normalized[:MAX_SHINGLE_CHARS]
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def minhash(normalized: str) -> Tuple[int, ...]:
+    """
+    文字3-gramの集合の MinHash 署名
+
+    2つの署名で値が一致する位置の割合は、3-gramの集合の Jaccard 係数の推定値になる。
+    一語の置き換えや末尾への数文字の追加では集合の大半が変わらないため、署名の大半も一致する。
+    """
+    values = [_hash64(shingle) for shingle in shingles(normalized)]
+    return tuple(min(map(mask.__xor__, values)) for mask in _PERMUTATION_MASKS)
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """2つの MinHash 署名から推定した Jaccard 係数"""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, int]]:
+    return [
+        (band, hash(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]))
+        for band in range(LSH_BANDS)
+    ]
+
+class _Cluster:
+    """同一または類似の本文の出現記録"""
+
+    __slots__ = ('exact', 'signature', 'occurrences', 'last_seen')
+
+    def __init__(self, exact: int, signature: Tuple[int, ...], max_occurrences: int):
+        self.exact = exact
+        self.signature = signature
+        # (時刻, guild_id, channel_id, user_id, 任意のデータ)
+        self.occurrences = deque(maxlen=max_occurrences)
+        self.last_seen = 0.0
+
+class FingerprintStore:
+    """
+    最近の本文の指紋（完全一致ハッシュと MinHash 署名）を短時間だけ保持し、
+    同じ・ほぼ同じ内容がいくつのチャンネルで何回投稿されたかを数える
+
+    似た本文は署名を帯に分けた索引（LSH）で候補を引き、署名から推定した Jaccard 係数が
+    min_similarity 以上のものを同じ本文とみなす。登録数に関係なく、1件あたりの処理は本文の長さに比例する。
+    ttl 秒以上出現のない指紋は破棄し、max_clusters を超えた分は最も古いものから追い出す。
+    """
+
+    def __init__(self, ttl: float = 60.0, min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                 max_clusters: int = 20000, max_occurrences: int = 50, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self.max_clusters = max_clusters
+        self.max_occurrences = max_occurrences
+        self.clock = clock
+        self._clusters: 'OrderedDict[int, _Cluster]' = OrderedDict()
+        self._by_exact: Dict[int, int] = {}
+        self._by_band: Dict[Tuple[int, int], Set[int]] = {}
+        self._next_id = 0
+
+    def _remove(self, cluster_id: int) -> None:
+        cluster = self._clusters.pop(cluster_id)
+        if self._by_exact.get(cluster.exact) == cluster_id:
+            del self._by_exact[cluster.exact]
+        for band in _bands(cluster.signature):
+            members = self._by_band.get(band)
+            if members is not None:
+                members.discard(cluster_id)
+                if not members:
+                    del self._by_band[band]
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.ttl
+        while self._clusters:
+            cluster_id, cluster = next(iter(self._clusters.items()))
+            if cluster.last_seen > cutoff and len(self._clusters) <= self.max_clusters:
+                break
+            self._remove(cluster_id)
+
+    def _find(self, exact: int, signature: Tuple[int, ...], bands: List[Tuple[int, int]]) -> Optional[int]:
+        cluster_id = self._by_exact.get(exact)
+        if cluster_id is not None:
+            return cluster_id
+        checked: Set[int] = set()
+        for band in bands:
+            for candidate in self._by_band.get(band, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if similarity(self._clusters[candidate].signature, signature) >= self.min_similarity:
+                    return candidate
+        return None
+
+    def add(self, normalized: str, guild_id: int, channel_id: int, user_id: int,
+            data: Any = None) -> _Cluster:
+        """
+        本文の出現を記録し、同じ・似た本文の出現記録（ttl 秒以内）を返す
+
+        Parameters
+        ----------
+        normalized : str
+            normalize_text() 済みの本文
+        data : Any
+            出現ごとに保持する任意のデータ（メッセージなど）
+        """
+        now = self.clock()
+        self._expire(now)
+        exact = content_hash(normalized)
+        signature = minhash(normalized)
+        bands = _bands(signature)
+
+        cluster_id = self._find(exact, signature, bands)
+        if cluster_id is None:
+            cluster_id = self._next_id
+            self._next_id += 1
+            cluster = self._clusters[cluster_id] = _Cluster(exact, signature, self.max_occurrences)
+            self._by_exact[exact] = cluster_id
+            for band in bands:
+                self._by_band.setdefault(band, set()).add(cluster_id)
+        else:
+            cluster = self._clusters[cluster_id]
+            self._clusters.move_to_end(cluster_id)
+
+        cutoff = now - self.ttl
+        occurrences = cluster.occurrences
+        while occurrences and occurrences[0][0] <= cutoff:
+            occurrences.popleft()
+        occurrences.append((now, guild_id, channel_id, user_id, data))
+        cluster.last_seen = now
+        return cluster
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'clusters': len(self._clusters),
+            'exact_keys': len(self._by_exact),
+            'bands': len(self._by_band),
+        }
+
+    def __len__(self) -> int:
+        return len(self._clusters)
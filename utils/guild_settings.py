@@ -0,0 +1,273 @@
+from typing import Any, FrozenSet, Mapping, Optional
+
+# スパム対策の既定値（ギルド設定・グローバル設定で上書きされなかった項目に使う）
+DEFAULT_SPAM_SETTINGS = {
+    'message_count': 5,
+    'time_window': 5,
+    'action': 'timeout',
+    'timeout_duration': 300,
+    'purge_window': 600,  # スパム検出時に削除する直近のメッセージの期間（秒）
+    'mention_limit': 15,  # mention_window 秒間のメンション数（ユーザー・ロール・@everyone）の上限
+    'mention_window': 60
+}
+
+SPAM_ACTIONS = ('timeout', 'delete', 'ban')
+
+# 集計期間の上限（秒）。AntiSpam はこの期間より長く発言のないユーザーの記録を破棄する
+SPAM_WINDOW_LIMITS = {
+    'time_window': 300,
+    'mention_window': 3600
+}
+
+# 参加レイド対策の既定値
+DEFAULT_RAID_SETTINGS = {
+    'enabled': False,          # サーバー全体の設定を変更するため、/setraid で有効にしたギルドだけで動かす
+    'join_threshold': 10,      # join_window 秒間の参加（重み付き）がこれ以上でロックダウン
+    'join_window': 60,
+    'new_account_days': 7,     # 作成からこの日数未満のアカウントは重みを大きくする
+    'lockdown_duration': 600,  # 最後に閾値を超えてからロックダウンを解除するまでの秒数
+    'verification_level': 'high',
+    'slowmode': 10,            # ロックダウン中のテキストチャンネルの低速モード（秒、0で変更しない）
+    'timeout_joiners': False,  # ロックダウン中の参加者をタイムアウトするか
+    'timeout_duration': 600
+}
+
+VERIFICATION_LEVELS = ('none', 'low', 'medium', 'high', 'highest')
+
+# 自動低速モードの既定値
+DEFAULT_SLOWMODE_SETTINGS = {
+    'enabled': False,          # チャンネルの設定を変更するため、/setautoslowmode で有効にしたギルドだけで動かす
+    'rate_threshold': 60,      # 1分あたりのメッセージ数（推定）がこれ以上で低速モードを1段階上げる
+    'author_threshold': 5,     # 同時に発言している人数（推定）がこれ未満なら上げない（個人の連投はスパム対策に任せる）
+    'max_delay': 30,           # 自動で設定する低速モードの上限（秒）
+    'hold_time': 120,          # 変更してから次に変更するまでの最短の秒数
+    'max_edits_per_hour': 6    # 1チャンネルあたり1時間に変更する回数の上限
+}
+
+# ユーザー単位の統計を残す日数（stats_retention_days で上書き可能）
+DEFAULT_STATS_RETENTION_DAYS = 90
+
+def _channel_id(value: Any) -> Optional[int]:
+    """設定値（int / 数字の文字列 / None）をチャンネルIDに変換する"""
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+class _Frozen:
+    """生成後に属性を変更できないクラスの基底"""
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class SpamPolicy(_Frozen):
+    """ギルドのスパム対策設定（既定値を反映済み）"""
+
+    __slots__ = (
+        'message_count', 'time_window', 'action', 'timeout_duration', 'purge_window', 'mention_limit',
+        'mention_window'
+    )
+
+    def __init__(self, message_count: int, time_window: int, action: str, timeout_duration: int,
+                 purge_window: int, mention_limit: int, mention_window: int):
+        object.__setattr__(self, 'message_count', message_count)
+        object.__setattr__(self, 'time_window', time_window)
+        object.__setattr__(self, 'action', action)
+        object.__setattr__(self, 'timeout_duration', timeout_duration)
+        object.__setattr__(self, 'purge_window', purge_window)
+        object.__setattr__(self, 'mention_limit', mention_limit)
+        object.__setattr__(self, 'mention_window', mention_window)
+
+    @classmethod
+    def from_dict(cls, *layers: Optional[Mapping[str, Any]]) -> 'SpamPolicy':
+        """
+        既定値の上に layers を順に重ねて作る（後のものほど優先）
+
+        不正な値の項目は既定値のままにする。
+        """
+        merged = dict(DEFAULT_SPAM_SETTINGS)
+        for layer in layers:
+            if layer:
+                merged.update(layer)
+
+        def positive_int(key: str) -> int:
+            try:
+                value = int(merged[key])
+            except (TypeError, ValueError):
+                return DEFAULT_SPAM_SETTINGS[key]
+            return value if value > 0 else DEFAULT_SPAM_SETTINGS[key]
+
+        action = merged.get('action')
+        return cls(
+            message_count=positive_int('message_count'),
+            time_window=min(positive_int('time_window'), SPAM_WINDOW_LIMITS['time_window']),
+            action=action if action in SPAM_ACTIONS else DEFAULT_SPAM_SETTINGS['action'],
+            timeout_duration=positive_int('timeout_duration'),
+            purge_window=positive_int('purge_window'),
+            mention_limit=positive_int('mention_limit'),
+            mention_window=min(positive_int('mention_window'), SPAM_WINDOW_LIMITS['mention_window'])
+        )
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class RaidPolicy(_Frozen):
+    """ギルドの参加レイド対策設定（既定値を反映済み）"""
+
+    __slots__ = (
+        'enabled', 'join_threshold', 'join_window', 'new_account_days', 'lockdown_duration',
+        'verification_level', 'slowmode', 'timeout_joiners', 'timeout_duration'
+    )
+
+    def __init__(self, enabled: bool, join_threshold: int, join_window: int, new_account_days: int,
+                 lockdown_duration: int, verification_level: str, slowmode: int,
+                 timeout_joiners: bool, timeout_duration: int):
+        object.__setattr__(self, 'enabled', enabled)
+        object.__setattr__(self, 'join_threshold', join_threshold)
+        object.__setattr__(self, 'join_window', join_window)
+        object.__setattr__(self, 'new_account_days', new_account_days)
+        object.__setattr__(self, 'lockdown_duration', lockdown_duration)
+        object.__setattr__(self, 'verification_level', verification_level)
+        object.__setattr__(self, 'slowmode', slowmode)
+        object.__setattr__(self, 'timeout_joiners', timeout_joiners)
+        object.__setattr__(self, 'timeout_duration', timeout_duration)
+
+    @classmethod
+    def from_dict(cls, *layers: Optional[Mapping[str, Any]]) -> 'RaidPolicy':
+        """既定値の上に layers を順に重ねて作る（後のものほど優先、不正な値は既定値）"""
+        merged = dict(DEFAULT_RAID_SETTINGS)
+        for layer in layers:
+            if layer:
+                merged.update(layer)
+
+        def int_at_least(key: str, minimum: int) -> int:
+            try:
+                value = int(merged[key])
+            except (TypeError, ValueError):
+                return DEFAULT_RAID_SETTINGS[key]
+            return value if value >= minimum else DEFAULT_RAID_SETTINGS[key]
+
+        level = merged.get('verification_level')
+        return cls(
+            enabled=bool(merged.get('enabled')),
+            join_threshold=int_at_least('join_threshold', 1),
+            join_window=int_at_least('join_window', 1),
+            new_account_days=int_at_least('new_account_days', 0),
+            lockdown_duration=int_at_least('lockdown_duration', 1),
+            verification_level=level if level in VERIFICATION_LEVELS else DEFAULT_RAID_SETTINGS['verification_level'],
+            slowmode=min(int_at_least('slowmode', 0), 21600),
+            timeout_joiners=bool(merged.get('timeout_joiners')),
+            timeout_duration=int_at_least('timeout_duration', 1)
+        )
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class SlowmodePolicy(_Frozen):
+    """ギルドの自動低速モード設定（既定値を反映済み）"""
+
+    __slots__ = ('enabled', 'rate_threshold', 'author_threshold', 'max_delay', 'hold_time', 'max_edits_per_hour')
+
+    def __init__(self, enabled: bool, rate_threshold: int, author_threshold: int, max_delay: int,
+                 hold_time: int, max_edits_per_hour: int):
+        object.__setattr__(self, 'enabled', enabled)
+        object.__setattr__(self, 'rate_threshold', rate_threshold)
+        object.__setattr__(self, 'author_threshold', author_threshold)
+        object.__setattr__(self, 'max_delay', max_delay)
+        object.__setattr__(self, 'hold_time', hold_time)
+        object.__setattr__(self, 'max_edits_per_hour', max_edits_per_hour)
+
+    @classmethod
+    def from_dict(cls, *layers: Optional[Mapping[str, Any]]) -> 'SlowmodePolicy':
+        """既定値の上に layers を順に重ねて作る（後のものほど優先、不正な値は既定値）"""
+        merged = dict(DEFAULT_SLOWMODE_SETTINGS)
+        for layer in layers:
+            if layer:
+                merged.update(layer)
+
+        def positive_int(key: str) -> int:
+            try:
+                value = int(merged[key])
+            except (TypeError, ValueError):
+                return DEFAULT_SLOWMODE_SETTINGS[key]
+            return value if value > 0 else DEFAULT_SLOWMODE_SETTINGS[key]
+
+        return cls(
+            enabled=bool(merged.get('enabled')),
+            rate_threshold=positive_int('rate_threshold'),
+            author_threshold=positive_int('author_threshold'),
+            max_delay=min(positive_int('max_delay'), 21600),
+            hold_time=positive_int('hold_time'),
+            max_edits_per_hour=positive_int('max_edits_per_hour')
+        )
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class GuildSettings(_Frozen):
+    """
+    1ギルド分の設定（グローバル設定と既定値を反映済み）
+
+    ConfigManager.get_settings() が設定変更ごとに1回だけ作り、ギルドID(int)をキーに
+    キャッシュする。イベントハンドラでは dict を辿らず属性で参照すること。
+    """
+
+    __slots__ = (
+        'guild_id', 'log_channel_id', 'vc_log_channel_id', 'mod_log_channel_id',
+        'photo_archive_channel_id', 'banned_words', 'spam', 'raid', 'slowmode', 'stats_retention_days'
+    )
+
+    def __init__(self, guild_id: int, log_channel_id: Optional[int], vc_log_channel_id: Optional[int],
+                 mod_log_channel_id: Optional[int], photo_archive_channel_id: Optional[int],
+                 banned_words: FrozenSet[str], spam: SpamPolicy, raid: RaidPolicy,
+                 slowmode: SlowmodePolicy, stats_retention_days: int):
+        object.__setattr__(self, 'guild_id', guild_id)
+        object.__setattr__(self, 'log_channel_id', log_channel_id)
+        object.__setattr__(self, 'vc_log_channel_id', vc_log_channel_id)
+        object.__setattr__(self, 'mod_log_channel_id', mod_log_channel_id)
+        object.__setattr__(self, 'photo_archive_channel_id', photo_archive_channel_id)
+        object.__setattr__(self, 'banned_words', banned_words)
+        object.__setattr__(self, 'spam', spam)
+        object.__setattr__(self, 'raid', raid)
+        object.__setattr__(self, 'slowmode', slowmode)
+        object.__setattr__(self, 'stats_retention_days', stats_retention_days)
+
+    @classmethod
+    def from_config(cls, guild_id: int, guild_config: Optional[Mapping[str, Any]],
+                    global_config: Optional[Mapping[str, Any]]) -> 'GuildSettings':
+        guild_config = guild_config or {}
+        global_config = global_config or {}
+
+        retention = guild_config.get('stats_retention_days')
+        if retention is None:
+            retention = global_config.get('stats_retention_days', DEFAULT_STATS_RETENTION_DAYS)
+        try:
+            retention = max(int(retention), 1)
+        except (TypeError, ValueError):
+            retention = DEFAULT_STATS_RETENTION_DAYS
+
+        return cls(
+            guild_id=guild_id,
+            log_channel_id=_channel_id(guild_config.get('log_channel')),
+            vc_log_channel_id=_channel_id(guild_config.get('vc_log_channel')),
+            mod_log_channel_id=_channel_id(guild_config.get('mod_log_channel')),
+            photo_archive_channel_id=_channel_id(
+                guild_config.get('photo_archive_channel') or global_config.get('photo_archive_channel')
+            ),
+            banned_words=frozenset(guild_config.get('banned_words') or ()),
+            spam=SpamPolicy.from_dict(global_config.get('spam_settings'), guild_config.get('spam_settings')),
+            raid=RaidPolicy.from_dict(global_config.get('raid_settings'), guild_config.get('raid_settings')),
+            slowmode=SlowmodePolicy.from_dict(
+                global_config.get('slowmode_settings'), guild_config.get('slowmode_settings')
+            ),
+            stats_retention_days=retention
+        )
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+_STOP = object()
+
+class IncidentJournal:
+    """
+    スパム対処の記録を1件1行のNDJSONとして追記するジャーナル
+
+    record() はキューに入れるだけでイベントループを止めない。書き込みは専用のスレッドが
+    キューに溜まった分をまとめて行い、fsync もまとめて1回にする。
+    ファイルが max_bytes を超えたら incidents.ndjson.1, .2 ... とずらして backup_count 個まで残す。
+    """
+
+    def __init__(self, directory: str = 'logs/spam', filename: str = 'incidents.ndjson',
+                 max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, flush_interval: float = 1.0):
+        self.directory = directory
+        self.path = os.path.join(directory, filename)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger('bot.incidents')
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._lock = threading.Lock()  # 書き込み・ローテーションと読み込みの排他
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._writer, name='incident-journal', daemon=True)
+        self._thread.start()
+
+    def record(self, incident: Dict[str, Any]) -> None:
+        """記録をキューに追加する（時刻が無ければ付ける）"""
+        incident.setdefault('ts', datetime.now(timezone.utc).isoformat(timespec='seconds'))
+        self._queue.put(incident)
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # 少し待って、同時に発生した記録をまとめて書き込む
+            stop = item is _STOP
+            while not stop:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval if len(batch) == 1 else 0)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            records = [record for record in batch if record is not _STOP]
+            if records:
+                try:
+                    self._write(records)
+                except Exception as e:
+                    self.logger.error(f"スパム記録の書き込みに失敗しました: {e}")
+            if stop:
+                return
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+        with self._lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _rotate(self) -> None:
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def query(self, guild_id: int, user_id: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        ギルド（とユーザー）の記録を新しい順に最大 limit 件返す
+
+        ファイルの読み込みを伴うため、イベントループからは run_in_executor で呼ぶこと。
+        """
+        results: List[Dict[str, Any]] = []
+        paths = [self.path] + [f"{self.path}.{index}" for index in range(1, self.backup_count + 1)]
+        with self._lock:
+            for path in paths:
+                if not os.path.exists(path):
+                    continue
+                matches = []
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if record.get('guild_id') != guild_id:
+                            continue
+                        if user_id is not None and record.get('user_id') != user_id:
+                            continue
+                        matches.append(record)
+                results.extend(reversed(matches))
+                if len(results) >= limit:
+                    break
+        return results[:limit]
+
+    def close(self, timeout: float = 5.0) -> None:
+        """キューに残っている記録を書き込んでからスレッドを止める"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
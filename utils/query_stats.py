@@ -0,0 +1,107 @@
+import logging
+import re
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence
+
+# レイテンシのヒストグラムの境界（ミリ秒）。最後のバケットはそれ以上すべて
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_sql(sql: str, max_length: int = 160) -> str:
+    """空白をまとめて1行にし、集計用のキーにする"""
+    text = _WHITESPACE.sub(' ', sql).strip()
+    return text if len(text) <= max_length else text[:max_length - 3] + '...'
+
+def describe_params(params: Any, max_items: int = 8) -> str:
+    """パラメータの値ではなく型と長さだけを表した文字列（ログに値を残さないため）"""
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        items = [f"{key}: {type(value).__name__}" for key, value in list(params.items())[:max_items]]
+        return '{' + ', '.join(items) + '}'
+    if isinstance(params, (list, tuple)):
+        if params and isinstance(params[0], (list, tuple)):
+            # executemany の場合は件数と1行目の形を示す
+            return f"{len(params)} x {describe_params(params[0], max_items)}"
+        items = []
+        for value in params[:max_items]:
+            name = type(value).__name__
+            if isinstance(value, (str, bytes)):
+                name += f"[{len(value)}]"
+            items.append(name)
+        if len(params) > max_items:
+            items.append('...')
+        return '(' + ', '.join(items) + ')'
+    return type(params).__name__
+
+class StatementStats:
+    """1種類のSQL文についての集計"""
+
+    __slots__ = ('count', 'total_ms', 'max_ms', 'rows', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms: float, rows: int) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if rows > 0:
+            self.rows += rows
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+    def percentile_ms(self, percentile: float) -> float:
+        """ヒストグラムから求めたパーセンタイル（バケットの上限値）"""
+        if not self.count:
+            return 0.0
+        target = self.count * percentile / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+class QueryStats:
+    """
+    SQL文ごとのレイテンシと影響行数の集計、およびスロークエリのログ
+
+    閾値を超えた文はパラメータの形とともに bot.db.slow ロガーへ出力する。
+    """
+
+    def __init__(self, slow_threshold_ms: float = 100.0):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.slow_logger = logging.getLogger('bot.db.slow')
+        self._statements: Dict[str, StatementStats] = {}
+        self.slow_count = 0
+
+    def record(self, sql: str, elapsed_ms: float, rows: int = -1,
+               params: Optional[Sequence[Any]] = None) -> None:
+        key = normalize_sql(sql)
+        stats = self._statements.get(key)
+        if stats is None:
+            stats = self._statements[key] = StatementStats()
+        stats.add(elapsed_ms, rows)
+
+        if elapsed_ms >= self.slow_threshold_ms:
+            self.slow_count += 1
+            self.slow_logger.warning(
+                f"Slow query ({elapsed_ms:.1f} ms, rows: {rows}): {key} params={describe_params(params)}"
+            )
+
+    def top(self, limit: int = 10) -> List[tuple]:
+        """合計時間の長い順に (SQL, StatementStats) を返す"""
+        return sorted(self._statements.items(), key=lambda item: item[1].total_ms, reverse=True)[:limit]
+
+    def reset(self) -> None:
+        self._statements.clear()
+        self.slow_count = 0
@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+class RecentMessageIndex:
+    """
+    キー（(guild_id, user_id)）ごとの直近 retention 秒に投稿されたメッセージの (channel_id, message_id, data)
+
+    スパム検出時に全チャンネルの履歴を取得する代わりに、ここから削除対象を直接引く。
+    data にはメッセージごとの小さな値（本文のハッシュなど）を添えられる。Message は保持しない。
+    時刻は time.monotonic() で記録し、古いものは追加・参照時に先頭から捨てる。
+    キーは最後に投稿があった順に並べ、max_keys を超えたら最も古いものから追い出す。
+    """
+
+    def __init__(self, retention: float = 600.0, max_keys: int = 50000, max_per_key: int = 500,
+                 clock: Callable[[], float] = time.monotonic):
+        self.retention = retention
+        self.max_keys = max_keys
+        self.max_per_key = max_per_key
+        self.clock = clock
+        self._entries: 'OrderedDict[Hashable, deque]' = OrderedDict()
+        self.evicted = 0
+
+    def add(self, key: Hashable, channel_id: int, message_id: int, data: Any = None) -> None:
+        now = self.clock()
+        entries = self._entries.get(key)
+        if entries is None:
+            entries = self._entries[key] = deque(maxlen=self.max_per_key)
+            if len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._entries.move_to_end(key)
+        entries.append((now, channel_id, message_id, data))
+        self._trim(entries, now - self.retention)
+
+    @staticmethod
+    def _trim(entries: deque, cutoff: float) -> None:
+        while entries and entries[0][0] <= cutoff:
+            entries.popleft()
+
+    def recent(self, key: Hashable, window: float) -> List[Tuple[int, int, Any]]:
+        """直近 window 秒（最大 retention 秒）の (channel_id, message_id, data) を古い順に返す"""
+        entries = self._entries.get(key)
+        if not entries:
+            return []
+        now = self.clock()
+        self._trim(entries, now - self.retention)
+        cutoff = now - window
+        return [entry[1:] for entry in entries if entry[0] > cutoff]
+
+    def pop(self, key: Hashable) -> None:
+        """キーの記録を消す（削除済みのユーザーなど）"""
+        self._entries.pop(key, None)
+
+    def sweep(self) -> int:
+        """retention 秒以上投稿のないキーを削除する"""
+        cutoff = self.clock() - self.retention
+        removed = 0
+        while self._entries:
+            key, entries = next(iter(self._entries.items()))
+            if entries and entries[-1][0] > cutoff:
+                break
+            del self._entries[key]
+            removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'keys': len(self._entries),
+            'messages': sum(len(entries) for entries in self._entries.values()),
+            'evicted': self.evicted,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
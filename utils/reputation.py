@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+# この値を下回った評判は「問題なし」とみなして保持しない
+MIN_SCORE = 0.05
+# 評判による閾値の引き下げの下限（元の閾値に対する割合）
+MAX_TIGHTEN_RATIO = 1 / 3
+
+class _Reputation:
+    __slots__ = ('score', 'incidents', 'last_guild_id', 'updated_at')
+
+    def __init__(self, score: float, incidents: int, last_guild_id: Optional[int], updated_at: float):
+        self.score = score
+        self.incidents = incidents
+        self.last_guild_id = last_guild_id
+        self.updated_at = updated_at
+
+class ReputationStore:
+    """
+    サーバーをまたいだユーザーの評判（スパム対処の履歴）
+
+    スパム対処1回ごとにスコアを加算し、half_life 秒ごとに半減させる。
+    メモリ上では最近のユーザーをLRUで最大 max_entries 件保持し、score() はO(1)で引ける。
+    変更は flush_interval 秒ごとにまとめて user_reputation テーブルへ書き込み、
+    起動時には最近更新されたものを読み込んでおく（キャッシュにないユーザーはバックグラウンドで読み込む）。
+    """
+
+    def __init__(self, db, half_life: float = 7 * 24 * 3600, max_entries: int = 20000,
+                 flush_interval: float = 30.0):
+        self.db = db
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger('bot.reputation')
+        self._entries: 'OrderedDict[int, _Reputation]' = OrderedDict()
+        self._dirty: Dict[int, _Reputation] = {}
+        # DBを確認済みのユーザー（キャッシュになければ評判なし）
+        self._checked: 'OrderedDict[int, None]' = OrderedDict()
+        self._loading: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def _decayed(self, entry: _Reputation, now: float) -> float:
+        elapsed = max(now - entry.updated_at, 0.0)
+        return entry.score * math.pow(0.5, elapsed / self.half_life)
+
+    def _put(self, user_id: int, entry: _Reputation) -> None:
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.max_entries:
+            # 未保存の変更は _dirty に残っているため、追い出しても失われない。
+            # 確認済みの印も外し、次に必要になったときはDBから読み直す
+            evicted, _ = self._entries.popitem(last=False)
+            self._checked.pop(evicted, None)
+
+    def _mark_checked(self, user_id: int) -> None:
+        self._checked[user_id] = None
+        self._checked.move_to_end(user_id)
+        if len(self._checked) > self.max_entries * 4:
+            self._checked.popitem(last=False)
+
+    def score(self, user_id: int) -> float:
+        """
+        ユーザーの現在の評判スコア（0なら問題なし、スパム対処1回直後で約1）
+
+        キャッシュにないユーザーは0を返し、DBからの読み込みをバックグラウンドで開始する。
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            return self._decayed(entry, time.time())
+        if user_id not in self._checked and user_id not in self._loading:
+            self._loading.add(user_id)
+            asyncio.get_running_loop().create_task(self._load(user_id))
+        return 0.0
+
+    async def _load(self, user_id: int) -> None:
+        try:
+            row = await self.db.get_reputation(user_id)
+            if row is not None and user_id not in self._entries:
+                _, score, incidents, last_guild_id, updated_at = row
+                self._put(user_id, _Reputation(score, incidents, last_guild_id, updated_at))
+            self._mark_checked(user_id)
+        except Exception as e:
+            self.logger.error(f"評判の読み込みに失敗しました（{user_id}）: {e}")
+        finally:
+            self._loading.discard(user_id)
+
+    async def record_incident(self, user_id: int, guild_id: int, weight: float = 1.0) -> float:
+        """
+        スパム対処を記録し、更新後のスコアを返す
+
+        DBをまだ確認していないユーザーは、保存済みの評判を読み込んでから加算する
+        （新しい記録で既存の行を上書きしないため）。
+        """
+        if user_id not in self._entries and user_id not in self._checked:
+            await self._load(user_id)
+        now = time.time()
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = _Reputation(0.0, 0, None, now)
+        entry.score = self._decayed(entry, now) + weight
+        entry.incidents += 1
+        entry.last_guild_id = guild_id
+        entry.updated_at = now
+        self._put(user_id, entry)
+        self._mark_checked(user_id)
+        self._dirty[user_id] = entry
+        return entry.score
+
+    def tightened(self, limit: int, user_id: int, minimum: int = 3) -> int:
+        """
+        評判に応じて閾値を引き下げる（limit / (1 + スコア) を切り上げた値）
+
+        他のサーバーで1回対処されただけでも下がる（スコア1で約半分）。下げ幅は元の閾値の
+        MAX_TIGHTEN_RATIO までとし、minimum 未満にはしない（元の閾値より上げることもない）。
+        """
+        score = self.score(user_id)
+        if score < MIN_SCORE:
+            return limit
+        floor = max(minimum, math.ceil(limit * MAX_TIGHTEN_RATIO))
+        return min(limit, max(floor, math.ceil(limit / (1.0 + score))))
+
+    async def start(self) -> None:
+        """最近の評判を読み込み、定期的な書き込みを開始する"""
+        # MIN_SCORE まで減衰するより前に更新されたものだけ読み込めばよい
+        since = int(time.time() - self.half_life * math.log2(1 / MIN_SCORE))
+        try:
+            for user_id, score, incidents, last_guild_id, updated_at in await self.db.load_reputations(
+                since, self.max_entries
+            ):
+                self._entries[user_id] = _Reputation(score, incidents, last_guild_id, updated_at)
+                self._checked[user_id] = None
+            # 新しい順に読み込んだので、LRUの順序（古い順）に並べ替える
+            for user_id in reversed(list(self._entries)):
+                self._entries.move_to_end(user_id)
+        except Exception as e:
+            self.logger.error(f"評判の読み込みに失敗しました: {e}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> int:
+        """未保存の変更を書き込む"""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        rows = [
+            (user_id, entry.score, entry.incidents, entry.last_guild_id, int(entry.updated_at))
+            for user_id, entry in dirty.items()
+        ]
+        try:
+            await self.db.save_reputations(rows)
+        except (Exception, asyncio.CancelledError) as e:
+            for user_id, entry in dirty.items():
+                self._dirty.setdefault(user_id, entry)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.logger.error(f"評判の書き込みに失敗しました: {e}")
+            return 0
+        return len(rows)
+
+    async def prune(self) -> int:
+        """十分に減衰した評判をDBから削除する"""
+        cutoff = int(time.time() - self.half_life * math.log2(1 / MIN_SCORE))
+        return await self.db.prune_reputations(cutoff)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {'cached': len(self._entries), 'dirty': len(self._dirty), 'checked': len(self._checked)}
@@ -0,0 +1,119 @@
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Hashable
+
+class _Window:
+    """1キー分のイベント（時刻と重み）と重みの合計"""
+
+    __slots__ = ('events', 'total', 'last_seen')
+
+    def __init__(self):
+        self.events = deque()
+        self.total = 0.0
+        self.last_seen = 0.0
+
+    def trim(self, cutoff: float) -> None:
+        events = self.events
+        while events and events[0][0] <= cutoff:
+            self.total -= events.popleft()[1]
+        if not events:
+            # 浮動小数の誤差を溜めない
+            self.total = 0.0
+
+class SlidingWindowCounter:
+    """
+    キー（(guild_id, user_id) など）ごとのスライディングウィンドウ
+
+    hit() はイベントを追加してウィンドウ外の古いものを先頭から捨てるだけなので、
+    1回あたり償却O(1)で済む。時刻は time.monotonic() を使うため、システム時刻の変更の影響を受けない。
+    キーは最後に使われた順に並べており、idle_ttl 秒使われていないキーは sweep() で、
+    max_keys を超えた分は最も古いものから追い出す。
+    """
+
+    def __init__(self, max_keys: int = 50000, idle_ttl: float = 600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self._windows: 'OrderedDict[Hashable, _Window]' = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def hit(self, key: Hashable, window: float, weight: float = 1.0) -> float:
+        """
+        イベントを記録し、直近 window 秒の重みの合計を返す
+
+        Parameters
+        ----------
+        key : Hashable
+            集計するキー
+        window : float
+            ウィンドウの長さ（秒）
+        weight : float
+            イベントの重み（メッセージ数なら1、メンション数など）
+        """
+        now = self.clock()
+        entry = self._windows.get(key)
+        if entry is None:
+            entry = self._windows[key] = _Window()
+            if len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._windows.move_to_end(key)
+        entry.last_seen = now
+        entry.events.append((now, weight))
+        entry.total += weight
+        entry.trim(now - window)
+        return entry.total
+
+    def count(self, key: Hashable, window: float) -> float:
+        """イベントを追加せずに直近 window 秒の重みの合計を返す"""
+        entry = self._windows.get(key)
+        if entry is None:
+            return 0.0
+        entry.trim(self.clock() - window)
+        return entry.total
+
+    def reset(self, key: Hashable) -> None:
+        """キーの記録を消す（対処済みのユーザーなど）"""
+        self._windows.pop(key, None)
+
+    def sweep(self) -> int:
+        """
+        idle_ttl 秒以上使われていないキーを削除する
+
+        キーは最後に使われた順に並んでいるため、先頭から期限切れのものだけを見ればよい。
+
+        Returns
+        -------
+        int
+            削除したキーの数
+        """
+        cutoff = self.clock() - self.idle_ttl
+        removed = 0
+        windows = self._windows
+        while windows:
+            key, entry = next(iter(windows.items()))
+            if entry.last_seen > cutoff:
+                break
+            del windows[key]
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """メモリ使用状況の確認用"""
+        return {
+            'keys': len(self._windows),
+            'events': sum(len(entry.events) for entry in self._windows.values()),
+            'max_keys': self.max_keys,
+            'evicted': self.evicted,
+            'expired': self.expired,
+        }
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._windows
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from database import day_number
+from .voice_sessions import VoiceSessionTracker
+
+class StatsBuffer:
+    """
+    メッセージ数とVC滞在時間をメモリ上で集計し、一定間隔でまとめてDBへ書き込むバッファ
+
+    キーは (guild_id, user_id, day) で、フラッシュ時には前回からの差分のみを
+    1トランザクションで加算する。
+    """
+
+    def __init__(self, db, flush_interval: float = 5.0):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger('bot.statsbuffer')
+        self._message_counts: Dict[Tuple[int, int, int], int] = defaultdict(int)
+        self._voice_seconds: Dict[Tuple[int, int, int], int] = defaultdict(int)
+        self._hourly_counts: Dict[Tuple[int, int], int] = defaultdict(int)
+        self.voice = VoiceSessionTracker(self)
+        self._task: Optional[asyncio.Task] = None
+
+    def record_message(self, guild_id: int, user_id: int, when: Optional[datetime] = None) -> None:
+        """メッセージ1件を集計に加える（DBアクセスは行わない）"""
+        when = when or datetime.now()
+        day = day_number(when.date())
+        self._message_counts[(guild_id, user_id, day)] += 1
+        self._hourly_counts[(guild_id, day * 24 + when.hour)] += 1
+
+    def add_voice_time(self, guild_id: int, user_id: int, day: int, seconds: int) -> None:
+        """VC滞在時間を集計に加える（VoiceSessionTrackerから呼ばれる）"""
+        self._voice_seconds[(guild_id, user_id, day)] += seconds
+
+    def start(self) -> None:
+        """定期フラッシュのタスクを開始する"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        溜まっている差分をDBへ書き込む
+
+        Returns
+        -------
+        int
+            書き込んだ行数
+        """
+        self.voice.checkpoint()
+        if not self._message_counts and not self._voice_seconds:
+            return 0
+
+        counts, self._message_counts = self._message_counts, defaultdict(int)
+        seconds, self._voice_seconds = self._voice_seconds, defaultdict(int)
+        hourly, self._hourly_counts = self._hourly_counts, defaultdict(int)
+        message_rows = [(guild_id, user_id, day, count) for (guild_id, user_id, day), count in counts.items()]
+        voice_rows = [(guild_id, user_id, day, total) for (guild_id, user_id, day), total in seconds.items()]
+        hourly_rows = [(guild_id, hour, count) for (guild_id, hour), count in hourly.items()]
+        try:
+            await self.db.add_stats(message_rows, voice_rows, hourly_rows)
+        except (Exception, asyncio.CancelledError) as e:
+            # 失敗した差分は戻して次回のフラッシュで再試行する
+            for key, count in counts.items():
+                self._message_counts[key] += count
+            for key, total in seconds.items():
+                self._voice_seconds[key] += total
+            for key, count in hourly.items():
+                self._hourly_counts[key] += count
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.logger.error(f"統計の書き込みに失敗しました: {e}")
+            return 0
+        return len(message_rows) + len(voice_rows)
+
+    async def close(self) -> None:
+        """タスクを停止し、開いているVCセッションを閉じて残りの差分を書き込む"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.voice.close_all()
+        await self.flush()
@@ -0,0 +1,115 @@
+"""
+活動統計（message_stats / voice_stats）のエクスポート
+
+行はカーソルから chunk_size 件ずつ読み出してそのまま gzip 圧縮したファイルへ書き込むため、
+ギルドの行数に関係なくメモリ使用量は一定に保たれる。
+
+コマンドラインからも実行できる:
+    python -m utils.stats_export --guild 123456789012345678 --kind messages --format csv
+"""
+import argparse
+import csv
+import gzip
+import json
+import sqlite3
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from database import day_to_date
+
+# kind -> (SQL, 出力する列名)
+EXPORT_QUERIES: Dict[str, Tuple[str, List[str]]] = {
+    'messages': (
+        'SELECT guild_id, user_id, day, message_count FROM message_stats '
+        'WHERE guild_id = ? ORDER BY day, user_id',
+        ['guild_id', 'user_id', 'date', 'message_count'],
+    ),
+    'voice': (
+        'SELECT guild_id, user_id, day, voice_time FROM voice_stats '
+        'WHERE guild_id = ? ORDER BY day, user_id',
+        ['guild_id', 'user_id', 'date', 'voice_time'],
+    ),
+}
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+def export_filename(guild_id: int, kind: str, fmt: str) -> str:
+    """エクスポートファイルの既定のファイル名"""
+    return f"{kind}_stats_{guild_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}.gz"
+
+def write_export(conn: sqlite3.Connection, guild_id: int, kind: str, fmt: str,
+                 out_path: str, chunk_size: int = 1000) -> int:
+    """
+    ギルドの統計を gzip 圧縮した CSV / NDJSON に書き出す
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        読み取りに使う接続（ReadPoolのワーカー接続など）
+    guild_id : int
+        対象のギルドID
+    kind : str
+        'messages' または 'voice'
+    fmt : str
+        'csv' または 'ndjson'
+    out_path : str
+        出力先のパス
+    chunk_size : int
+        1回に読み出す行数
+
+    Returns
+    -------
+    int
+        書き出した行数
+    """
+    if kind not in EXPORT_QUERIES:
+        raise ValueError(f"Unknown export kind: {kind}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    sql, columns = EXPORT_QUERIES[kind]
+    cursor = conn.execute(sql, (guild_id,))
+    total = 0
+    try:
+        with gzip.open(out_path, 'wt', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f) if fmt == 'csv' else None
+            if writer:
+                writer.writerow(columns)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for guild, user, day, value in rows:
+                    record = (guild, user, day_to_date(day).isoformat(), value)
+                    if writer:
+                        writer.writerow(record)
+                    else:
+                        f.write(json.dumps(dict(zip(columns, record)), ensure_ascii=False))
+                        f.write('\n')
+                total += len(rows)
+    finally:
+        cursor.close()
+    return total
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="活動統計をgzip圧縮したCSV/NDJSONに書き出す")
+    parser.add_argument('--db', default='bot_statistics.db', help="統計DBのパス")
+    parser.add_argument('--guild', type=int, required=True, help="対象のギルドID")
+    parser.add_argument('--kind', choices=sorted(EXPORT_QUERIES), default='messages')
+    parser.add_argument('--format', dest='fmt', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--out', help="出力先（省略時は自動で命名）")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    out_path = args.out or export_filename(args.guild, args.kind, args.fmt)
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    try:
+        count = write_export(conn, args.guild, args.kind, args.fmt, out_path, args.chunk_size)
+    finally:
+        conn.close()
+    print(f"{count} rows written to {out_path}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
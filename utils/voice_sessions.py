@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+import discord
+
+from database import day_number
+
+class VoiceSessionTracker:
+    """
+    VC滞在中のセッションをメモリ上で管理し、滞在時間をStatsBufferへ渡す
+
+    セッションは (guild_id, user_id) をキーに開始時刻を保持するだけで、
+    参加・退出・移動のたびにDBへアクセスすることはない。
+    滞在時間は日付ごとに0時で分割して記録する。
+    """
+
+    def __init__(self, stats_buffer, checkpoint_interval: float = 60.0):
+        self.stats_buffer = stats_buffer
+        self.checkpoint_interval = checkpoint_interval
+        self.logger = logging.getLogger('bot.voicesessions')
+        self._sessions: Dict[Tuple[int, int], datetime] = {}
+        self._last_checkpoint = datetime.now()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @staticmethod
+    def _is_tracked_channel(channel) -> bool:
+        """滞在時間を数えるチャンネルかどうか（AFKチャンネルは除外）"""
+        if channel is None:
+            return False
+        afk_channel = getattr(channel.guild, 'afk_channel', None)
+        return afk_channel is None or channel.id != afk_channel.id
+
+    def open(self, guild_id: int, user_id: int, when: Optional[datetime] = None) -> None:
+        """セッションを開始する（既に開始済みなら何もしない）"""
+        # 秒未満を切り捨てておき、チェックポイントごとの端数の取りこぼしを防ぐ
+        self._sessions.setdefault((guild_id, user_id), (when or datetime.now()).replace(microsecond=0))
+
+    def close(self, guild_id: int, user_id: int, when: Optional[datetime] = None) -> None:
+        """セッションを終了し、滞在時間を記録する"""
+        start = self._sessions.pop((guild_id, user_id), None)
+        if start is not None:
+            self._account(guild_id, user_id, start, (when or datetime.now()).replace(microsecond=0))
+
+    def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState,
+                              after: discord.VoiceState) -> None:
+        """参加・退出・移動に応じてセッションを開閉する"""
+        if member.bot or before.channel == after.channel:
+            return
+
+        was_tracked = self._is_tracked_channel(before.channel)
+        is_tracked = self._is_tracked_channel(after.channel)
+
+        # 通常チャンネル間の移動はセッションを継続する
+        if is_tracked and not was_tracked:
+            self.open(member.guild.id, member.id)
+        elif was_tracked and not is_tracked:
+            self.close(member.guild.id, member.id)
+
+    def recover_guild(self, guild: discord.Guild) -> None:
+        """
+        起動時・再接続時に現在のVC参加者からセッションを復元する
+
+        切断中に退出したメンバーのセッションはここで終了させる。
+        """
+        present = set()
+        for channel in guild.voice_channels:
+            if not self._is_tracked_channel(channel):
+                continue
+            for member in channel.members:
+                if member.bot:
+                    continue
+                present.add(member.id)
+                self.open(guild.id, member.id)
+
+        for guild_id, user_id in list(self._sessions):
+            if guild_id == guild.id and user_id not in present:
+                self.close(guild_id, user_id)
+
+    def checkpoint(self, force: bool = False) -> None:
+        """
+        開いているセッションの経過時間をここまでの分だけ記録する
+
+        長時間滞在しているメンバーの時間も統計に反映され、
+        日付をまたいだセッションもここで分割される。
+        """
+        now = datetime.now().replace(microsecond=0)
+        if not force and (now - self._last_checkpoint).total_seconds() < self.checkpoint_interval \
+                and now.date() == self._last_checkpoint.date():
+            return
+        self._last_checkpoint = now
+        for key, start in self._sessions.items():
+            self._account(key[0], key[1], start, now)
+            self._sessions[key] = now
+
+    def close_all(self) -> None:
+        """シャットダウン時に全セッションを終了させる"""
+        now = datetime.now()
+        for guild_id, user_id in list(self._sessions):
+            self.close(guild_id, user_id, now)
+
+    def _account(self, guild_id: int, user_id: int, start: datetime, end: datetime) -> None:
+        for day, seconds in self._split_by_day(start, end):
+            self.stats_buffer.add_voice_time(guild_id, user_id, day, seconds)
+
+    @staticmethod
+    def _split_by_day(start: datetime, end: datetime) -> Iterator[Tuple[int, int]]:
+        """[start, end) を0時で区切り、(day, 秒数) を返す"""
+        while start < end:
+            next_midnight = datetime.combine(start.date() + timedelta(days=1), time.min)
+            segment_end = min(end, next_midnight)
+            seconds = int((segment_end - start).total_seconds())
+            if seconds > 0:
+                yield day_number(start.date()), seconds
+            start = segment_end